@@ -0,0 +1,215 @@
+import itertools
+import re
+import typing as t
+
+TAB_WIDTH = 8
+# xterm's default 16 colors, used when the theme doesn't define "ansi-colors"
+ANSI_COLORS = (
+    "#000000",
+    "#cd0000",
+    "#00cd00",
+    "#cdcd00",
+    "#0000ee",
+    "#cd00cd",
+    "#00cdcd",
+    "#e5e5e5",
+    "#7f7f7f",
+    "#ff0000",
+    "#00ff00",
+    "#ffff00",
+    "#5c5cff",
+    "#ff00ff",
+    "#00ffff",
+    "#ffffff",
+)
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+
+# CSI, OSC (ended by BEL or ST), a charset designation like ESC ( B
+# or any other two character escape
+ESCAPE_PATTERN = re.compile(
+    r"\x1b(?:\[([0-?]*)[ -/]*([@-~])|\][^\x07\x1b]*(?:\x07|\x1b\\)|[()*+].|[^\[\]])"
+)
+# An escape cut off by the end of a line that is still being written
+PARTIAL_ESCAPE_PATTERN = re.compile(r"\x1b(?:\[[0-?]*[ -/]*|\][^\x07\x1b]*|[()*+])?$")
+# Control characters that take no space, keeping tab and carriage return
+CONTROL_PATTERN = re.compile(r"[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f]")
+
+# A palette index, an (r, g, b) truecolor or None for the theme's default
+Color = t.Union[int, tuple[int, int, int], None]
+
+
+class Style(t.NamedTuple):
+    fg: Color = None
+    bg: Color = None
+    bold: bool = False
+    underline: bool = False
+    inverse: bool = False
+
+
+PLAIN = Style()
+# Styles in spans are stored as plain tuples: unlike a Style, the garbage
+# collector stops tracking those, which keeps its passes short with
+# millions of lines around. Style._make turns one back.
+Span = tuple[str, tuple]
+
+
+def extended_color(codes: list[int], i: int) -> tuple[Color, int]:
+    """Reads a 38/48 color starting at `codes[i]`, returning
+    the color and the index of its last code"""
+
+    if codes[i + 1 : i + 2] == [5] and len(codes) > i + 2:
+        return min(codes[i + 2], 255), i + 2
+    if codes[i + 1 : i + 2] == [2] and len(codes) > i + 4:
+        return tuple(min(code, 255) for code in codes[i + 2 : i + 5]), i + 4
+    return None, len(codes)
+
+
+def apply_sgr(style: Style, params: str) -> Style:
+    codes = [int(code) if code.isdigit() else 0 for code in params.split(";")]
+    i = 0
+    while i < len(codes):
+        code = codes[i]
+        if code == 0:
+            style = PLAIN
+        elif code == 1:
+            style = style._replace(bold=True)
+        elif code == 22:
+            style = style._replace(bold=False)
+        elif code == 4:
+            style = style._replace(underline=True)
+        elif code == 24:
+            style = style._replace(underline=False)
+        elif code == 7:
+            style = style._replace(inverse=True)
+        elif code == 27:
+            style = style._replace(inverse=False)
+        elif 30 <= code <= 37:
+            style = style._replace(fg=code - 30)
+        elif 90 <= code <= 97:
+            style = style._replace(fg=code - 90 + 8)
+        elif code == 39:
+            style = style._replace(fg=None)
+        elif 40 <= code <= 47:
+            style = style._replace(bg=code - 40)
+        elif 100 <= code <= 107:
+            style = style._replace(bg=code - 100 + 8)
+        elif code == 49:
+            style = style._replace(bg=None)
+        elif code in (38, 48):
+            color, i = extended_color(codes, i)
+            if code == 38:
+                style = style._replace(fg=color)
+            else:
+                style = style._replace(bg=color)
+        i += 1
+    return style
+
+
+def overstrike(spans: list[tuple[str, Style]]) -> list[tuple[str, Style]]:
+    """Applies carriage returns and tabs the way a terminal would,
+    so progress bars show only their latest state"""
+
+    cells = []
+    col = 0
+    for text, style in spans:
+        for char in text:
+            if char == "\r":
+                col = 0
+                continue
+            chars = " " * (TAB_WIDTH - col % TAB_WIDTH) if char == "\t" else char
+            for char in chars:
+                if col < len(cells):
+                    cells[col] = (char, style)
+                else:
+                    cells.append((char, style))
+                col += 1
+
+    return [
+        ("".join(char for char, _ in group), style)
+        for style, group in itertools.groupby(cells, key=lambda cell: cell[1])
+    ]
+
+
+def parse_line(line: str, style: Style) -> tuple[tuple[Span, ...], Style]:
+    """Splits a line into runs of equally styled text, given the style
+    in effect where it starts; returns them with the style it ends in"""
+
+    if "\x1b" not in line and not CONTROL_PATTERN.search(line):
+        if "\r" not in line and "\t" not in line:
+            return ((line, tuple(style)),), style
+        spans = [(line, style)]
+    else:
+        spans, style = parse_escapes(line, style)
+
+    spans = [(CONTROL_PATTERN.sub("", text), span_style) for text, span_style in spans]
+    if "\r" in line or "\t" in line:
+        spans = overstrike(spans)
+    runs = tuple((text, tuple(span_style)) for text, span_style in spans if text)
+    return runs or (("", tuple(style)),), style
+
+
+def parse_escapes(line: str, style: Style) -> tuple[list[tuple[str, Style]], Style]:
+    """Runs of text between escapes and the style left in effect"""
+
+    spans = []
+    pos = 0
+    for match in ESCAPE_PATTERN.finditer(line):
+        if match.start() > pos:
+            spans.append((line[pos : match.start()], style))
+        pos = match.end()
+        params = match[1] or ""
+        if match[2] == "m" and not params.startswith(("<", "=", ">", "?")):
+            style = apply_sgr(style, params.replace(":", ";"))
+    tail = PARTIAL_ESCAPE_PATTERN.sub("", line[pos:])
+    spans.append((tail, style))
+    return spans, style
+
+
+def plain_text(lines: t.Iterable[t.Sequence[Span]]) -> str:
+    return "\n".join("".join(text for text, _ in spans) for spans in lines)
+
+
+def slice_spans(spans: t.Sequence[Span], start: int, end: int) -> tuple[Span, ...]:
+    """The part of a line between two character offsets"""
+
+    sliced = []
+    pos = 0
+    for text, style in spans:
+        low, high = max(start - pos, 0), min(end - pos, len(text))
+        if low < high:
+            sliced.append((text[low:high], style))
+        pos += len(text)
+        if pos >= end:
+            break
+    return tuple(sliced) or (("", spans[0][1]),)
+
+
+def palette_color(index: int, theme: dict) -> str | tuple[int, int, int]:
+    if index < 16:
+        return theme.get("ansi-colors", ANSI_COLORS)[index]
+    if index < 232:
+        index -= 16
+        return (
+            CUBE_LEVELS[index // 36],
+            CUBE_LEVELS[index // 6 % 6],
+            CUBE_LEVELS[index % 6],
+        )
+    gray = 8 + (index - 232) * 10
+    return (gray, gray, gray)
+
+
+def resolve_color(color: Color, theme: dict):
+    if isinstance(color, int):
+        return palette_color(color, theme)
+    return color
+
+
+def resolve(style: Style, theme: dict) -> tuple:
+    """Foreground and background colors of a style under a theme,
+    where a background of None means transparent"""
+
+    fg = resolve_color(style.fg, theme) or theme["output-color"]
+    bg = resolve_color(style.bg, theme)
+    if style.inverse:
+        fg, bg = bg or theme["background-color"], fg
+    return fg, bg
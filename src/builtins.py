@@ -0,0 +1,80 @@
+import os
+import shlex
+from pathlib import Path
+
+from src.shared import Shared
+
+# Anything that needs the shell's own parsing or expansion
+SHELL_CHARS = frozenset("();<>|&$`*?[{}!\n")
+TERMINAL_BUILTINS = ("clear", "cls", "exit")
+
+
+def tokenize(command: str) -> list[str] | None:
+    """Splits a simple command line, or returns None if only the shell can"""
+
+    if SHELL_CHARS & set(command):
+        return None
+    try:
+        tokens = shlex.split(command, posix=os.name != "nt")
+    except ValueError:
+        return None
+    if os.name == "nt":
+        tokens = [token.strip("\"'") for token in tokens]
+    return tokens
+
+
+class Builtins:
+    """Commands handled in-process, without spawning anything.
+
+    Each handler gets the command's arguments and returns its output,
+    exit code and the directory the next prompt should spawn in.
+    """
+
+    def __init__(self) -> None:
+        self.shared = Shared()
+        self.handlers = {
+            "cd": self.cd,
+            "pwd": self.pwd,
+            "history": self.history,
+        }
+
+    def parse(self, command: str) -> list[str] | None:
+        """Returns the tokens of the command line if it is a builtin"""
+
+        tokens = tokenize(command)
+        if not tokens:
+            return None
+        if tokens[0] in self.handlers or tokens[0] in TERMINAL_BUILTINS:
+            return tokens
+        return None
+
+    def run(self, tokens: list[str]) -> tuple[str, int, Path]:
+        handler = self.handlers.get(tokens[0])
+        if handler is None:
+            # clear and exit act on the terminal itself
+            return "", 0, self.shared.cwd
+        return handler(tokens[1:])
+
+    def cd(self, args: list[str]) -> tuple[str, int, Path]:
+        if len(args) > 1:
+            return "cd: too many arguments", 1, self.shared.cwd
+        if not args:
+            target = Path.home()
+        elif args[0] == "-":
+            target = self.shared.previous_cwd or self.shared.cwd
+        else:
+            target = self.shared.cwd / Path(args[0]).expanduser()
+
+        if not target.is_dir():
+            return f"cd: no such directory: {target}", 1, self.shared.cwd
+        return "", 0, target.resolve()
+
+    def pwd(self, args: list[str]) -> tuple[str, int, Path]:
+        return str(self.shared.cwd), 0, self.shared.cwd
+
+    def history(self, args: list[str]) -> tuple[str, int, Path]:
+        lines = (
+            f"{n:>5}  {command}"
+            for n, command in enumerate(self.shared.data.history, 1)
+        )
+        return "\n".join(lines), 0, self.shared.cwd
@@ -1,67 +1,84 @@
+import time
+
 import pygame
 import pyperclip
 
+from src.glyphs import render_text
 from src.shared import Shared
-from src.utils import Time, get_font, render_at
+from src.utils import get_font
 
 
 class CopyButton:
     TEXT = "Copy"
     SIZE = WIDTH, HEIGHT = 80, 25
     FONT = get_font("assets/fonts/bold1.ttf", 16)
+    CLICK_TIME = 0.15
 
-    def __init__(self, output: str) -> None:
-        self.shared = Shared()
-        self.output = output
-        self.hover_surf = pygame.Surface(self.SIZE)
-        self.surf = pygame.Surface(self.SIZE)
-        self.click_surf = pygame.Surface(self.SIZE)
-
-        self.text_surf = self.FONT.render(self.TEXT, "True", "white")
-        self.text_rect = self.text_surf.get_rect()
+    # There's a button per prompt, so they share their surfaces
+    __slots__ = ("prompt", "image", "hovering", "clicked", "rect", "clicked_at")
+    shared = Shared()
+    surfaces: dict[str, pygame.Surface] = {}
 
-        # Colors
-        self.hover_surf.fill("grey")
-        self.surf.fill((100, 100, 100))
-        self.click_surf.fill("green")
+    def __init__(self, prompt) -> None:
+        self.prompt = prompt
+        if not self.surfaces:
+            self.make_surfaces()
 
-        self.image = self.surf
+        self.image = self.surfaces["idle"]
         self.hovering = False
         self.clicked = False
         self.rect = self.image.get_rect()
-        self.click_timer = Time(0.15)
-        self.color_click = False
+        self.clicked_at: float | None = None
+
+    @classmethod
+    def make_surfaces(cls):
+        for name, color in (
+            ("idle", (100, 100, 100)),
+            ("hover", "grey"),
+            ("click", "green"),
+        ):
+            surf = pygame.Surface(cls.SIZE)
+            surf.fill(color)
+            surf.set_alpha(150)
+            cls.surfaces[name] = surf
+        cls.surfaces["text"] = render_text(cls.FONT, cls.TEXT, "white")
+
+    @property
+    def color_click(self) -> bool:
+        return (
+            self.clicked_at is not None
+            and time.perf_counter() - self.clicked_at < self.CLICK_TIME
+        )
 
     def on_hover(self):
         if not self.hovering and not self.color_click:
-            self.image = self.surf
+            self.image = self.surfaces["idle"]
             return
 
-        self.image = self.hover_surf
+        self.image = self.surfaces["hover"]
 
     def on_click(self):
-        if self.click_timer.tick():
-            self.color_click = False
-
         if self.color_click:
-            self.image = self.click_surf
+            self.image = self.surfaces["click"]
+            self.shared.scheduler.request(self.clicked_at + self.CLICK_TIME)
         if not self.clicked:
             return
 
-        self.click_timer.reset()
-        self.color_click = True
-        pyperclip.copy(self.output.strip())
+        self.clicked_at = time.perf_counter()
+        pyperclip.copy((self.prompt.output or "").strip())
 
     def update(self):
         self.hovering = self.rect.collidepoint(self.shared.mouse_pos)
         self.clicked = self.shared.clicked and self.hovering
 
+        image = self.image
         self.on_hover()
         self.on_click()
+        if self.image is not image:
+            self.shared.damage.add(self.rect)
 
     def draw(self, offset):
-        self.image.set_alpha(150)
         self.rect.topleft = (300, offset + 32)
-        self.text_rect.center = self.rect.center
         self.shared.screen.blit(self.image, self.rect)
-        self.shared.screen.blit(self.text_surf, self.text_rect)
+        text_surf = self.surfaces["text"]
+        self.shared.screen.blit(text_surf, text_surf.get_rect(center=self.rect.center))
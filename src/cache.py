@@ -0,0 +1,58 @@
+import collections
+
+import pygame
+
+
+class SurfaceCache:
+    """Rendered surfaces shared by every prompt, keyed by whatever they
+    depend on and kept under a byte budget. Once past it, the least
+    recently used ones go first."""
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.surfaces: collections.OrderedDict[
+            tuple, pygame.Surface
+        ] = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def byte_size(surf: pygame.Surface) -> int:
+        return surf.get_pitch() * surf.get_height()
+
+    def get(self, key: tuple) -> pygame.Surface | None:
+        surf = self.surfaces.get(key)
+        if surf is None:
+            self.misses += 1
+            return None
+        self.surfaces.move_to_end(key)
+        self.hits += 1
+        return surf
+
+    def put(self, key: tuple, surf: pygame.Surface) -> None:
+        self.discard(key)
+        self.surfaces[key] = surf
+        self.size += self.byte_size(surf)
+        # The newest one stays even if it's over the budget on its own
+        while self.size > self.budget and len(self.surfaces) > 1:
+            _, evicted = self.surfaces.popitem(last=False)
+            self.size -= self.byte_size(evicted)
+            self.evictions += 1
+
+    def discard(self, key: tuple) -> None:
+        surf = self.surfaces.pop(key, None)
+        if surf is not None:
+            self.size -= self.byte_size(surf)
+
+    def clear(self) -> None:
+        self.surfaces.clear()
+        self.size = 0
+
+    def stats(self) -> str:
+        return (
+            f"surfaces {len(self.surfaces)}"
+            f"  {self.size / 2**20:.1f}/{self.budget / 2**20:.0f} MiB"
+            f"  hits {self.hits}  misses {self.misses}  evictions {self.evictions}"
+        )
@@ -1,3 +1,4 @@
+from src.glyphs import render_text
 from src.shared import Shared
 from src.utils import get_font, render_at
 
@@ -8,15 +9,17 @@ class ControlState:
     def __init__(self) -> None:
         self.next_state = None
         self.shared = Shared()
-        self.surface = self.FONT.render(
+        self.surface = render_text(
+            self.FONT,
             """
 CTRL + Q -> Controls
 CTRL + T -> Terminal
 CTRL + S -> Settings
 CTRL + X -> Delete Line
 CTRL + G -> Goto top
+CTRL + R -> Search history
+F3       -> Debug overlay
             """,
-            True,
             self.shared.data.theme["text-color"],
         )
 
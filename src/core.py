@@ -5,14 +5,33 @@ import time
 import pygame
 import pygame._sdl2
 
+from src.cache import SurfaceCache
+from src.damage import Damage
 from src.data import DataManager
+from src.scheduler import FrameScheduler
 from src.shared import Shared
 
 
 class Core:
+    # Events after which the window has to be drawn whole again
+    REDRAW_EVENTS = (
+        pygame.VIDEORESIZE,
+        pygame.VIDEOEXPOSE,
+        pygame.WINDOWEXPOSED,
+        pygame.WINDOWSHOWN,
+        pygame.WINDOWRESTORED,
+        pygame.WINDOWMAXIMIZED,
+        pygame.WINDOWSIZECHANGED,
+    )
+
     def __init__(self) -> None:
         self.shared = Shared()
         self.shared.data = DataManager()
+        self.shared.surfaces = SurfaceCache(
+            self.shared.data.config["surface-cache-size"]
+        )
+        self.shared.scheduler = FrameScheduler(self.shared.data.config["max-fps"])
+        self.shared.damage = Damage()
         self.win_init()
         from src.states import StateManager
 
@@ -24,7 +43,9 @@ class Core:
 
     def win_init(self):
         pygame.init()
-        self.screen = pygame.display.set_mode((1024, 600), pygame.RESIZABLE)
+        self.screen = pygame.display.set_mode(
+            (1024, 600), pygame.RESIZABLE, vsync=self.shared.data.config["vsync"]
+        )
 
         self.shared.win = pygame._sdl2.Window.from_display_module()
         self.shared.win.opacity = self.shared.data.config["opacity"]
@@ -41,11 +62,13 @@ class Core:
                 self.shared.clicked = True
 
     def update(self):
-        self.shared.events = pygame.event.get()
+        self.shared.events = self.shared.scheduler.take_events()
         for event in self.shared.events:
             if event.type == pygame.QUIT:
                 self.shared.data.on_exit()
                 raise SystemExit
+            if event.type in self.REDRAW_EVENTS:
+                self.shared.damage.everything()
 
         self.on_click()
         self.shared.dt = self.clock.tick() / 1000
@@ -56,17 +79,31 @@ class Core:
 
         self.state_manager.update()
 
-        pygame.display.flip()
-
     def draw(self):
-        self.screen.fill((self.shared.data.theme["background-color"]))
-        self.state_manager.draw()
+        """Draws the whole window, or when only parts of it changed,
+        draws everything clipped to each of them and pushes just those"""
+
+        rects = self.shared.damage.take()
+        if rects is None:
+            self.screen.fill(self.shared.data.theme["background-color"])
+            self.state_manager.draw()
+            pygame.display.flip()
+            return
+        if not rects:
+            return
+
+        for rect in rects:
+            self.screen.set_clip(rect)
+            self.screen.fill(self.shared.data.theme["background-color"])
+            self.state_manager.draw()
+        self.screen.set_clip(None)
+        pygame.display.update(rects)
 
     async def run(self):
         while True:
             self.update()
             self.draw()
-            await asyncio.sleep(0)
+            await self.shared.scheduler.wait()
 
 
 def main():
@@ -0,0 +1,67 @@
+import pygame
+
+from src.shared import Shared
+
+
+class Damage:
+    """Regions of the window that changed since the last frame. Whatever
+    changes what it draws adds the rect it covers, and only those get
+    drawn again and pushed to the display. Changes that move everything,
+    like resizing, scrolling or switching theme, ask for the whole
+    window instead, as do frames where the rects would add up to most
+    of it anyway.
+    """
+
+    MAX_RECTS = 8
+    # Past this share of the window, one full redraw is cheaper
+    MAX_SHARE = 0.5
+
+    def __init__(self) -> None:
+        self.shared = Shared()
+        self.rects: list[pygame.Rect] = []
+        self.whole = True
+
+    def add(self, rect) -> None:
+        if not self.whole:
+            self.rects.append(pygame.Rect(rect))
+
+    def below(self, top: int) -> None:
+        """Damages everything from `top` down, for changes that
+        push what comes after them"""
+
+        width, height = self.shared.screen.get_size()
+        self.add((0, top, width, height - top))
+
+    def everything(self) -> None:
+        self.whole = True
+        self.rects.clear()
+
+    def take(self) -> list[pygame.Rect] | None:
+        """Returns the damaged rects, merged where they overlap,
+        or None when the whole window needs drawing"""
+
+        whole, rects = self.whole, self.rects
+        self.whole = False
+        self.rects = []
+        if whole:
+            return None
+
+        bounds = self.shared.screen.get_rect()
+        merged: list[pygame.Rect] = []
+        for rect in rects:
+            rect = rect.clip(bounds)
+            if not rect.width or not rect.height:
+                continue
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect.union_ip(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+
+        area = sum(rect.width * rect.height for rect in merged)
+        if (
+            len(merged) > self.MAX_RECTS
+            or area > bounds.width * bounds.height * self.MAX_SHARE
+        ):
+            return None
+        return merged
@@ -1,6 +1,9 @@
 import json
+import threading
+import time
 from pathlib import Path
 
+from src.history import History, HistoryIndex, HistoryJournal, cwd_key, frecency, replay
 from src.shared import Shared
 
 
@@ -19,19 +22,6 @@ def read_text_file(file_path: Path) -> list[str]:
     return file_path.read_text().splitlines()
 
 
-def write_text_file(file_path: Path, data: list[str]) -> None:
-    with open(file_path, "w") as f:
-        f.write("\n".join(data))
-
-
-def exact_match(command_history, command):
-    for c in command_history[::-1]:
-        if c.startswith(command):
-            return c
-
-    return None
-
-
 def read_config_file(path: Path):
     with open(path) as f:
         return json.load(f)
@@ -42,24 +32,98 @@ def write_config_file(path: Path, data: dict):
         return json.dump(data, f, indent=2)
 
 
+DEFAULT_CONFIG = {
+    "image": None,
+    "theme": "default.json",
+    "opacity": 1.0,
+    "shell": "pwsh",
+    "isolate-commands": False,
+    "pool-size": 2,
+    "pty": False,
+    "command-timeout": 0,
+    "max-jobs": 4,
+    "spool-threshold": 16777216,
+    "surface-cache-size": 67108864,
+    "debug-overlay": False,
+    "max-fps": 60,
+    "vsync": False,
+    "history-limit": 1000000,
+}
+
+
 class DataManager:
     DATA_FOLDER = get_path("assets/data/")
-    COMMAND_HISTORY_FILE = get_path("assets/data/command-history.txt")
+    HISTORY_FILE = get_path("assets/data/history.jsonl")
+    # Where history was kept before the journal, moved into it once
+    OLD_HISTORY_FILE = Path("assets/data/command-history.txt")
     CONFIG_FILE = get_path("assets/data/config.json")
-    HISTORY_LIMIT = 50
+    # Repeats the journal can hold before it's compacted, at least
+    COMPACT_SLACK = 1024
 
     def __init__(self) -> None:
         self.shared = Shared()
-        self.history_init()
         self.config_init()
+        self.history_init()
 
     def history_init(self):
-        self.command_history = read_text_file(self.COMMAND_HISTORY_FILE)
-        self.__current_index = len(self.command_history) - 1
-        self.current_line = self.command_history[self.__current_index]
+        """Starts from the tail of the journal, reading the rest on a thread"""
+
+        self.journal = HistoryJournal(self.HISTORY_FILE)
+        self.import_old_history()
+        self.history_lock = threading.Lock()
+        # Commands run but not in the journal yet, with when they were run
+        # and their score after, put back on top of the whole journal
+        self.unlogged: list[tuple[str, float, float]] = []
+        history, scores, cwd_scores = History(), {}, {}
+        replay(self.journal.tail(), history, scores, cwd_scores)
+        self.set_history(history, scores, cwd_scores)
+        threading.Thread(target=self.load_history, daemon=True).start()
+
+    def import_old_history(self):
+        if self.HISTORY_FILE.stat().st_size or not self.OLD_HISTORY_FILE.exists():
+            return
+        for command in read_text_file(self.OLD_HISTORY_FILE):
+            self.journal.append({"command": command})
+
+    def load_history(self):
+        """Reads the whole journal, compacting it first once it's
+        mostly repeats or holds more than the limit"""
+
+        entries, end = self.journal.read()
+        history, scores, cwd_scores = History(), {}, {}
+        replay(entries, history, scores, cwd_scores)
+        limit = self.config["history-limit"]
+        with self.history_lock:
+            # Logged while the rest was read
+            later, _ = self.journal.read(end)
+            entries += later
+            replay(later, history, scores, cwd_scores)
+            # The last run of a command in each directory it ran in is kept
+            repeats = len(entries) - len(cwd_scores)
+            if (
+                repeats > max(len(cwd_scores), self.COMPACT_SLACK)
+                or len(history) > limit
+            ):
+                entries = self.journal.compact(entries, limit, scores, cwd_scores)
+                history, scores, cwd_scores = History(), {}, {}
+                replay(entries, history, scores, cwd_scores)
+            for command, when, _ in self.unlogged:
+                history.add(command)
+                scores[command] = frecency(scores.get(command), when)
+            self.set_history(history, scores, cwd_scores)
+
+    def set_history(
+        self, history: History, scores: dict[str, float], cwd_scores: dict[str, float]
+    ):
+        self.history = history
+        # Suggestions go to the command run most and latest, first of
+        # those run in the current directory
+        self.history_index = HistoryIndex(scores)
+        self.cwd_index = HistoryIndex(cwd_scores)
+        self.current_index = len(history.commands)
 
     def config_init(self):
-        self.config = read_config_file(self.CONFIG_FILE)
+        self.config = DEFAULT_CONFIG | read_config_file(self.CONFIG_FILE)
         self.theme_file = Path(f"assets/data/themes/{self.config['theme']}")
 
         with open(self.theme_file) as f:
@@ -79,21 +143,77 @@ class DataManager:
 
     @current_index.setter
     def current_index(self, val):
-        c_len = len(self.command_history)
-        if val >= c_len:
+        commands = self.history.commands
+        if val >= len(commands):
             val = 0
         if val < 0:
-            val = c_len - 1
+            val = len(commands) - 1
         self.__current_index = val
 
-        self.current_line = self.command_history[self.__current_index]
-
-    def cap_history(self):
-        c_len = len(self.command_history)
-        if c_len > self.HISTORY_LIMIT:
-            self.command_history = self.command_history[c_len - self.HISTORY_LIMIT :]
+        self.current_line = commands[self.__current_index] if commands else ""
+
+    def step_history(self, step: int):
+        """Moves to the previous or next command, past blanked slots"""
+
+        for _ in range(len(self.history.commands)):
+            self.current_index += step
+            if self.current_line is not None:
+                return
+
+    def add_history(self, command: str):
+        """Moves the command to the end of the history and adds a use to
+        its score. Its score in a directory waits for `log_command`, as
+        a queued command only knows where it runs once it starts."""
+
+        when = time.time()
+        with self.history_lock:
+            score = frecency(self.history_index.ranks.get(command), when)
+            self.unlogged.append((command, when, score))
+            self.history.add(command)
+            self.history_index.add(command, score)
+            self.current_index = len(self.history.commands)
+
+    def suggest(self, prefix: str, cwd: Path) -> str | None:
+        """The best scored command starting with `prefix` that was run in
+        `cwd`, or anywhere when none was"""
+
+        key = self.cwd_index.suggest(cwd_key(cwd, prefix))
+        if key is not None:
+            return key.partition("\0")[2]
+        return self.history_index.suggest(prefix)
+
+    def log_command(
+        self,
+        command: str,
+        started: float | None,
+        cwd: Path,
+        exit_code: int | None,
+        duration: float | None,
+    ):
+        """Adds a use in `cwd` to the command's score there and appends
+        it to the journal with its scores"""
+
+        entry = {
+            "command": command,
+            "time": started,
+            "cwd": str(cwd),
+            "exit": exit_code,
+            "duration": None if duration is None else round(duration, 3),
+        }
+        with self.history_lock:
+            for n, (unlogged, when, score) in enumerate(self.unlogged):
+                if unlogged == command:
+                    del self.unlogged[n]
+                    entry["score"] = score
+                    break
+            else:
+                when = time.time()
+            key = cwd_key(cwd, command)
+            entry["cwd-score"] = frecency(self.cwd_index.ranks.get(key), when)
+            self.cwd_index.add(key, entry["cwd-score"])
+            self.journal.append(entry)
 
     def on_exit(self):
-        self.cap_history()
         write_config_file(self.CONFIG_FILE, self.config)
-        write_text_file(self.COMMAND_HISTORY_FILE, self.command_history)
+        with self.history_lock:
+            self.journal.close()
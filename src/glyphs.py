@@ -0,0 +1,204 @@
+import functools
+import os
+import typing as t
+import unicodedata
+
+import pygame
+
+
+@functools.lru_cache(maxsize=65536)
+def char_width(char: str) -> int:
+    """Columns a character takes in the grid: 2 for wide East Asian
+    characters, 0 for combining marks and other zero width ones"""
+
+    if unicodedata.combining(char) or unicodedata.category(char) in ("Mn", "Me", "Cf"):
+        return 0
+    if unicodedata.east_asian_width(char) in ("W", "F"):
+        return 2
+    return 1
+
+
+def clusters(text: str) -> list[tuple[str, int]]:
+    """Splits text into the runs drawn in a single slot, each with its
+    width in columns; zero width characters join the one before them"""
+
+    if text.isascii():
+        return [(char, 1) for char in text]
+    cells = []
+    for char in text:
+        width = char_width(char)
+        if width:
+            cells.append((char, width))
+        elif cells:
+            cells[-1] = (cells[-1][0] + char, cells[-1][1])
+    return cells
+
+
+def text_width(text: str) -> int:
+    """Width of text in columns"""
+
+    if text.isascii():
+        return len(text)
+    return sum(char_width(char) for char in text)
+
+
+def wrap_breaks(text: str, cols: int) -> tuple[int, ...]:
+    """Offsets of the characters that start each row after the first
+    when text is soft wrapped at `cols` columns"""
+
+    if len(text) <= cols and (text.isascii() or 2 * len(text) <= cols):
+        return ()
+    if text.isascii():
+        return tuple(range(cols, len(text), cols))
+    return wide_wrap_breaks(text, cols)
+
+
+@functools.lru_cache(maxsize=16384)
+def wide_wrap_breaks(text: str, cols: int) -> tuple[int, ...]:
+    """A wide character that doesn't fit moves whole to the next row,
+    and combining marks stay with the character they follow"""
+
+    breaks = []
+    col = 0
+    for index, char in enumerate(text):
+        width = char_width(char)
+        if width and col and col + width > cols:
+            breaks.append(index)
+            col = 0
+        col += width
+    return tuple(breaks)
+
+
+class GlyphAtlas:
+    """Glyphs of a monospace font in one color, each rasterized once into
+    a surface the width of the columns it takes. Text is composed by
+    blitting those in a single `fblits` call rather than rendered whole,
+    so changing a character doesn't rasterize the rest of the line.
+    """
+
+    atlases: dict[tuple, "GlyphAtlas"] = {}
+
+    def __init__(self, font: pygame.font.Font, color, underline: bool) -> None:
+        self.font = font
+        self.color = color
+        self.underline = underline
+        self.cell_width, self.height = font.size(" ")
+        self.glyphs: dict[str, pygame.Surface] = {}
+
+    @classmethod
+    def get(
+        cls, font: pygame.font.Font, color, underline: bool = False
+    ) -> "GlyphAtlas":
+        key = (font, color if isinstance(color, str) else tuple(color), underline)
+        atlas = cls.atlases.get(key)
+        if atlas is None:
+            atlas = cls.atlases[key] = cls(font, color, underline)
+        return atlas
+
+    def glyph(self, cluster: str, width: int) -> pygame.Surface:
+        glyph = self.glyphs.get(cluster)
+        if glyph is not None:
+            return glyph
+
+        self.font.underline = self.underline
+        glyph = self.font.render(cluster, True, self.color)
+        self.font.underline = False
+        size = (width * self.cell_width, self.height)
+        if glyph.get_size() != size:
+            # Wide characters get both their columns, overhangs are cut off
+            slot = pygame.Surface(size, pygame.SRCALPHA)
+            slot.blit(glyph, (0, 0))
+            glyph = slot
+        self.glyphs[cluster] = glyph
+        return glyph
+
+    def draw(self, surf: pygame.Surface, text: str, pos: t.Sequence[int]) -> int:
+        """Draws a line of text at `pos`, returning how wide it came out"""
+
+        x, y = pos
+        if text.isascii():
+            for char in set(text).difference(self.glyphs):
+                self.glyph(char, 1)
+            cell_width = self.cell_width
+            surf.fblits(
+                [
+                    (self.glyphs[char], (x + i * cell_width, y))
+                    for i, char in enumerate(text)
+                    if char != " " or self.underline
+                ]
+            )
+            return len(text) * cell_width
+
+        sequence = []
+        for cluster, width in clusters(text):
+            if cluster != " " or self.underline:
+                sequence.append((self.glyph(cluster, width), (x, y)))
+            x += width * self.cell_width
+        surf.fblits(sequence)
+        return x - pos[0]
+
+
+class GlyphLine:
+    """A line of text kept on a surface of its own, where a change only
+    redraws from the first column that differs, so typing a character
+    draws just that glyph. The surface grows with room to spare and
+    can be wider than the text on it.
+    """
+
+    MIN_COLUMNS = 64
+
+    def __init__(self) -> None:
+        self.atlas: GlyphAtlas | None = None
+        self.text = ""
+        self.surf: pygame.Surface | None = None
+
+    def render(self, atlas: GlyphAtlas, text: str) -> pygame.Surface:
+        columns = text_width(text)
+        if (
+            self.surf is None
+            or atlas is not self.atlas
+            or columns * atlas.cell_width > self.surf.get_width()
+        ):
+            size = (max(columns * 2, self.MIN_COLUMNS) * atlas.cell_width, atlas.height)
+            self.surf = pygame.Surface(size, pygame.SRCALPHA)
+            self.atlas = atlas
+            self.text = ""
+
+        # Typing and deleting only touch the end, the quick cases to check
+        if text.startswith(self.text):
+            same = len(self.text)
+        elif self.text.startswith(text):
+            same = len(text)
+        else:
+            same = len(os.path.commonprefix((self.text, text)))
+        # Don't split a character from the marks combined with it
+        while same and any(
+            same < len(line) and not char_width(line[same])
+            for line in (self.text, text)
+        ):
+            same -= 1
+        x = text_width(text[:same]) * atlas.cell_width
+        end = text_width(self.text) * atlas.cell_width
+        if end > x:
+            self.surf.fill((0, 0, 0, 0), (x, 0, end - x, atlas.height))
+        atlas.draw(self.surf, text[same:], (x, 0))
+        self.text = text
+        return self.surf
+
+
+def render_text(font: pygame.font.Font, text: str, color, background=None):
+    """Stands in for `Font.render`, composing the text out of glyphs
+    from the atlas; line breaks start new lines"""
+
+    atlas = GlyphAtlas.get(font, color)
+    lines = text.split("\n")
+    size = (
+        max(text_width(line) for line in lines) * atlas.cell_width,
+        len(lines) * atlas.height,
+    )
+    surf = pygame.Surface(size, pygame.SRCALPHA)
+    if background is not None:
+        surf.fill(background)
+    for row, line in enumerate(lines):
+        atlas.draw(surf, line, (0, row * atlas.height))
+    return surf
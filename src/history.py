@@ -0,0 +1,338 @@
+import array
+import bisect
+import json
+import math
+import os
+import threading
+import typing as t
+from pathlib import Path
+
+from src.utils import sorted_in_runs
+
+# Sorts after every character, so prefix + LAST_CHAR bounds all that start with it
+LAST_CHAR = chr(0x10FFFF)
+# A use counts half as much as one this much later
+HALF_LIFE = 7 * 24 * 60 * 60
+
+
+def frecency(score: float | None, when: float) -> float:
+    """Adds a use at `when` to a score. Each use weighs 2 ** (when /
+    HALF_LIFE) and the score is the log of their sum, so decaying every
+    score to the present would shift them all alike: their order holds
+    without updating the others, and a score only ever goes up."""
+
+    use = when * math.log(2) / HALF_LIFE
+    if score is None:
+        return use
+    high, low = (score, use) if score >= use else (use, score)
+    return high + math.log1p(math.exp(low - high))
+
+
+def cwd_key(cwd, command: str) -> str:
+    """Key of a command run in a directory, starting with the directory so
+    the commands run there share a prefix"""
+
+    return f"{cwd}\0{command}"
+
+
+class RankTree(t.NamedTuple):
+    """Commands in sorted order over a segment tree of their ranks"""
+
+    keys: list[str]
+    size: int
+    # Leaves hold the ranks, every node above the best rank under it
+    tree: array.array
+
+    SORT_RUN = 65536
+
+    @classmethod
+    def build(cls, ranks: t.Mapping[str, float]) -> "RankTree":
+        keys = sorted_in_runs(list(ranks), cls.SORT_RUN)
+        size = 1
+        while size < len(keys):
+            size *= 2
+        tree = array.array("d", [float("-inf")]) * (2 * size)
+        tree[size : size + len(keys)] = array.array("d", [ranks[key] for key in keys])
+        level = size
+        while level > 1:
+            tree[level // 2 : level] = array.array(
+                "d",
+                [
+                    left if left >= right else right
+                    for left, right in zip(
+                        tree[level : 2 * level : 2], tree[level + 1 : 2 * level : 2]
+                    )
+                ],
+            )
+            level //= 2
+        return cls(keys, size, tree)
+
+    def best(self, prefix: str) -> tuple[str | None, float]:
+        """The best ranked key starting with `prefix`, and its rank"""
+
+        start = bisect.bisect_left(self.keys, prefix) + self.size
+        end = bisect.bisect_right(self.keys, prefix + LAST_CHAR) + self.size
+        tree = self.tree
+        # Node 0 isn't used, its rank is -inf
+        best = 0
+        while start < end:
+            if start & 1:
+                if tree[start] > tree[best]:
+                    best = start
+                start += 1
+            if end & 1:
+                end -= 1
+                if tree[end] > tree[best]:
+                    best = end
+            start >>= 1
+            end >>= 1
+        if not best:
+            return None, tree[0]
+        # Down to the leaf the rank came from
+        while best < self.size:
+            best *= 2
+            if tree[best] != tree[best // 2]:
+                best += 1
+        return self.keys[best - self.size], tree[best]
+
+
+class HistoryIndex:
+    """Finds the best ranked command starting with a prefix, in time that
+    doesn't grow with the history. Commands are kept sorted, so the ones
+    sharing a prefix sit next to each other and bisect finds them, and a
+    segment tree over their ranks picks the best of that run.
+
+    Commands ranked since the tree was built wait in `recent`, checked
+    one by one, until there are RECENT_LIMIT of them and a new tree is
+    built on a thread. A rank only ever goes up, so a command's older
+    rank left in the tree can't beat anything it shouldn't.
+    """
+
+    RECENT_LIMIT = 512
+
+    def __init__(self, ranks: t.Mapping[str, float] | None = None) -> None:
+        self.ranks: dict[str, float] = dict(ranks or {})
+        self.tree = RankTree.build({})
+        self.recent: dict[str, float] = {}
+        # Ranked after the tree being built was started, before its time
+        self.building: dict[str, float] = {}
+        self.thread: threading.Thread | None = None
+        self.rebuild()
+
+    def rebuild(self):
+        """Starts building a tree of every rank so far on a thread"""
+
+        self.building.update(self.recent)
+        self.recent = {}
+        self.thread = threading.Thread(
+            target=self.build, args=(dict(self.ranks),), daemon=True
+        )
+        self.thread.start()
+
+    def build(self, ranks: dict[str, float]):
+        self.tree = RankTree.build(ranks)
+        # The new tree has all of them
+        self.building = {}
+        self.thread = None
+
+    def add(self, command: str, rank: float):
+        self.ranks[command] = rank
+        self.recent[command] = rank
+        if len(self.recent) > self.RECENT_LIMIT and self.thread is None:
+            self.rebuild()
+
+    def suggest(self, prefix: str) -> str | None:
+        """The best ranked command starting with `prefix`"""
+
+        suggestion, top = self.tree.best(prefix)
+        for ranks in (self.building, self.recent):
+            for command, rank in ranks.items():
+                if rank > top and command.startswith(prefix):
+                    suggestion, top = command, rank
+        return suggestion
+
+
+class History:
+    """Commands in the order they were last run, each once. A command run
+    again moves to the end; its old slot is only blanked, which keeps that
+    O(1), and the blanks are squeezed out once they outnumber the rest.
+    """
+
+    SPARE_BLANKS = 1024
+
+    def __init__(self, commands: t.Iterable[str] = ()) -> None:
+        self.commands: list[str | None] = []
+        self.positions: dict[str, int] = {}
+        for command in commands:
+            self.add(command)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __iter__(self) -> t.Iterator[str]:
+        return (command for command in self.commands if command is not None)
+
+    def __contains__(self, command: str) -> bool:
+        return command in self.positions
+
+    def add(self, command: str):
+        position = self.positions.get(command)
+        if position is not None:
+            self.commands[position] = None
+        self.positions[command] = len(self.commands)
+        self.commands.append(command)
+        if len(self.commands) > 2 * len(self.positions) + self.SPARE_BLANKS:
+            self.squeeze()
+
+    def squeeze(self):
+        self.commands = list(self)
+        self.positions = {command: n for n, command in enumerate(self.commands)}
+
+    def trim(self, limit: int):
+        """Forgets all but the last `limit` commands"""
+
+        if len(self) > limit:
+            self.commands = list(self)[len(self) - limit :]
+            self.positions = {command: n for n, command in enumerate(self.commands)}
+
+
+def replay(
+    entries: list[dict],
+    history: History,
+    scores: dict[str, float],
+    cwd_scores: dict[str, float],
+):
+    """Runs through journal entries in order, taking the scores they were
+    logged with, or working them out for entries logged without"""
+
+    for entry in entries:
+        command = entry["command"]
+        when = entry.get("time") or 0.0
+        history.add(command)
+        score = entry.get("score")
+        if score is None:
+            score = frecency(scores.get(command), when)
+        scores[command] = score
+        key = cwd_key(entry.get("cwd") or "", command)
+        score = entry.get("cwd-score")
+        if score is None:
+            score = frecency(cwd_scores.get(key), when)
+        cwd_scores[key] = score
+
+
+def parse_entries(data: bytes) -> list[dict]:
+    """Entries of a stretch of the journal, skipping lines that don't parse"""
+
+    lines = [line for line in data.decode(errors="replace").split("\n") if line]
+    try:
+        # All at once is several times quicker than line by line
+        entries = json.loads(f"[{','.join(lines)}]")
+    except json.JSONDecodeError:
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return [
+        entry for entry in entries if isinstance(entry, dict) and "command" in entry
+    ]
+
+
+class HistoryJournal:
+    """Every command run, appended to a file as one line of JSON each
+    with when and where it ran, its exit code, how long it took and its
+    frecency scores after it, overall and in that directory. Lines
+    are flushed as they're written, so a crash or kill loses at most the
+    one being written then, and reading skips a line cut short like that.
+
+    The journal only grows, so now and then `compact` rewrites it with
+    only the last run of each command in each directory.
+    """
+
+    TAIL_SIZE = 64 * 1024
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        if self.file.tell():
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # Cut short by a crash, so the next line starts on its own
+                    self.file.write("\n")
+
+    def append(self, entry: dict):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def read(self, start: int = 0) -> tuple[list[dict], int]:
+        """Entries from byte `start` on, and where the last whole line ends.
+        It goes a block at a time, as one long parse would hold the GIL
+        and stall the frames while the journal loads on its thread."""
+
+        entries = []
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            rest = b""
+            while block := f.read(self.READ_SIZE):
+                block = rest + block
+                end = block.rfind(b"\n") + 1
+                entries.extend(parse_entries(block[:end]))
+                rest = block[end:]
+                start += end
+        return entries, start
+
+    def tail(self) -> list[dict]:
+        """The last entries, read without going through the whole file"""
+
+        with open(self.path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(size - self.TAIL_SIZE, 0))
+            data = f.read()
+        if size > self.TAIL_SIZE:
+            # The first line is most likely only partly there
+            data = data[data.find(b"\n") + 1 :]
+        return parse_entries(data[: data.rfind(b"\n") + 1])
+
+    def compact(
+        self,
+        entries: list[dict],
+        limit: int,
+        scores: dict[str, float],
+        cwd_scores: dict[str, float],
+    ) -> list[dict]:
+        """Rewrites the journal, all of it in `entries`, with the last run
+        of each command in each directory, keeping the last `limit`
+        commands. The runs dropped still count towards the scores, so
+        the ones kept are logged with the scores after all of them.
+        Returns the entries it kept."""
+
+        latest: dict[tuple, dict] = {}
+        for entry in entries:
+            key = (entry["command"], entry.get("cwd"))
+            latest.pop(key, None)
+            latest[key] = entry
+        kept = list(latest.values())
+        commands = History(entry["command"] for entry in kept)
+        if len(commands) > limit:
+            commands.trim(limit)
+            kept = [entry for entry in kept if entry["command"] in commands]
+        for entry in kept:
+            command = entry["command"]
+            entry["score"] = scores[command]
+            entry["cwd-score"] = cwd_scores[cwd_key(entry.get("cwd") or "", command)]
+
+        temp = self.path.with_suffix(".tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in kept)
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(temp, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        return kept
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,47 @@
+import asyncio
+import typing as t
+
+
+class JobQueue:
+    """Runs submitted prompts with at most `limit` of them at once.
+
+    Jobs start in submission order. An exclusive job (a builtin like cd,
+    whose effect later commands depend on) waits for every earlier job
+    to finish, and every later job waits for it in turn. A serial job
+    waits for the serial job before it, as commands sharing the session
+    shell run one at a time, each in the env and directory the one
+    before left behind.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.semaphore = asyncio.Semaphore(max(limit, 1))
+        self.active: set[asyncio.Task] = set()
+        self.barrier: asyncio.Task | None = None
+        self.serial: asyncio.Task | None = None
+
+    def submit(
+        self,
+        job: t.Callable[[], t.Awaitable[None]],
+        exclusive: bool,
+        serial: bool = False,
+    ) -> asyncio.Task:
+        earlier = set(self.active) if exclusive else set()
+        if self.barrier is not None and not self.barrier.done():
+            earlier.add(self.barrier)
+        if serial and self.serial is not None and not self.serial.done():
+            earlier.add(self.serial)
+
+        task = asyncio.create_task(self.run(job, earlier))
+        self.active.add(task)
+        task.add_done_callback(self.active.discard)
+        if exclusive:
+            self.barrier = task
+        if serial:
+            self.serial = task
+        return task
+
+    async def run(self, job: t.Callable[[], t.Awaitable[None]], earlier: set):
+        if earlier:
+            await asyncio.wait(earlier)
+        async with self.semaphore:
+            await job()
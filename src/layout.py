@@ -0,0 +1,58 @@
+import array
+import bisect
+import time
+
+
+class LineLayout:
+    """Rows the output lines of a prompt take once soft wrapped at
+    `cols` columns, kept as a running sum over the lines counted so far.
+    Counting goes a batch at a time under a deadline, so after a resize
+    long outputs reflow over several frames; until then, lines not
+    counted yet are taken to be a row each.
+    """
+
+    BATCH = 256
+    __slots__ = ("cols", "starts")
+
+    def __init__(self, cols: int) -> None:
+        self.cols = cols
+        # Row each counted line starts at, then the rows they take in all
+        self.starts = array.array("I", [0])
+
+    @property
+    def counted(self) -> int:
+        return len(self.starts) - 1
+
+    def truncate(self, count: int) -> None:
+        """Forgets the lines from `count` on, as they changed"""
+
+        del self.starts[count + 1 :]
+
+    def reset(self, cols: int) -> None:
+        if cols != self.cols:
+            self.cols = cols
+            self.truncate(0)
+
+    def count(self, view, deadline: float) -> bool:
+        """Counts the rows of lines not counted yet until the deadline
+        passes, returning whether it got through all of them"""
+
+        line_count = view.line_count
+        while self.counted < line_count:
+            stop = min(self.counted + self.BATCH, line_count)
+            for index in range(self.counted, stop):
+                self.starts.append(self.starts[-1] + len(view.line_breaks(index)) + 1)
+            if time.perf_counter() >= deadline:
+                return self.counted >= line_count
+        return True
+
+    def rows(self, line_count: int) -> int:
+        return self.starts[-1] + max(line_count - self.counted, 0)
+
+    def line_at(self, row: int) -> tuple[int, int]:
+        """The line a row belongs to, and which of its rows it is"""
+
+        if row >= self.starts[-1]:
+            return self.counted + row - self.starts[-1], 0
+        index = bisect.bisect_right(self.starts, row) - 1
+        return index, row - self.starts[index]
@@ -0,0 +1,246 @@
+import asyncio
+import codecs
+import collections
+import time
+import typing as t
+
+from src.ansi import PLAIN, Span, Style, parse_line
+from src.spool import Spool, SpooledLines, lines_text
+
+
+class OutputBuffer:
+    """Line model of a command's output, fed incrementally
+    as chunks of bytes arrive from the process. Each line is parsed
+    once into styled spans, kept alongside it in `spans`.
+
+    Arriving bytes are only queued; `merge` turns them into lines once
+    per frame under a time budget, so a fast producer can't stall the
+    frame loop. Past HIGH_WATER queued bytes, or SPILL_HIGH lines waiting
+    for the spool, `drain` stops the reader until the frames catch up,
+    which in turn blocks the producer.
+
+    Once more than `spool_threshold` characters have come through, settled
+    lines move out to a `Spool` as they are parsed, leaving only the last
+    few in memory; `lines` and `parsed` then hold what comes after the
+    `spilled` ones, and `spans` reads through to the spool.
+
+    Lines spill as each chunk is parsed, so past the threshold only about
+    a chunk's worth stays in memory. Crossing it can leave millions of
+    lines to move, so spilling goes a batch at a time under the merge
+    deadline, and no more output is merged until it has caught up. The
+    lines written are dropped from memory on the next spill, since
+    dropping them shifts every line after.
+    """
+
+    MERGE_SIZE = 16 * 1024
+    PARSE_BATCH = 256
+    SPILL_BATCH = 4096
+    SPILL_HIGH = 4 * SPILL_BATCH
+    HIGH_WATER = 8 * 1024 * 1024
+    LOW_WATER = 1024 * 1024
+    # Lines kept back from the spool, as the last ones may still change
+    KEEP_LINES = 2
+
+    def __init__(self, spool_threshold: int = 0) -> None:
+        self.lines: list[str] = [""]
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.dirty_from = 0
+        self.parsed: list[tuple[Span, ...]] = []
+        # Style each parsed line leaves in effect for the next one
+        self.end_styles: list[Style] = []
+        self.spool_threshold = spool_threshold
+        self.size = 0
+        self.spool: Spool | None = None
+        self.spilled = 0
+        # Lines at the head of `lines` written to the spool already
+        self.written = 0
+        # Style in effect where the first line still in memory starts
+        self.carry_style = PLAIN
+        # Raw chunks, or whole lines queued by feed_line
+        self.backlog: collections.deque[bytes | str] = collections.deque()
+        self.backlog_size = 0
+        self.room = asyncio.Event()
+        self.room.set()
+        self.closing = False
+        self.closed = False
+
+    def feed(self, data: bytes) -> None:
+        self.backlog.append(data)
+        self.backlog_size += len(data)
+
+    def feed_text(self, text: str) -> None:
+        if not text:
+            return
+        parts = text.replace("\r\n", "\n").split("\n")
+        self.size += len(text)
+
+        # The last line may still be partial, so it gets re-rendered
+        self.dirty_from = min(self.dirty_from, self.line_count - 1)
+        self.lines[-1] += parts[0]
+        self.lines.extend(parts[1:])
+        del self.parsed[len(self.lines) - len(parts) :]
+        del self.end_styles[len(self.parsed) :]
+
+    def feed_line(self, text: str) -> None:
+        """Appends text on a line of its own, after anything still queued"""
+
+        self.backlog.append(text)
+
+    def put_line(self, text: str) -> None:
+        if self.lines[-1]:
+            self.feed_text("\n")
+        self.feed_text(text + "\n")
+
+    async def drain(self) -> None:
+        if self.backlog_size > self.HIGH_WATER or self.unspilled > self.SPILL_HIGH:
+            self.room.clear()
+        await self.room.wait()
+
+    @property
+    def spilling(self) -> bool:
+        return self.size > self.spool_threshold > 0
+
+    @property
+    def unspilled(self) -> int:
+        """Lines past the threshold still in memory, waiting for the spool"""
+
+        if not self.spilling:
+            return 0
+        return len(self.lines) - self.written
+
+    def merge(self, deadline: float) -> None:
+        """Turns queued output into lines until the deadline passes,
+        leaving the rest for the next frame"""
+
+        while True:
+            parsed = self.parse_lines(deadline)
+            if self.spilling:
+                self.spill(len(self.parsed) - self.KEEP_LINES, deadline)
+            if not parsed or not self.backlog:
+                break
+            if time.perf_counter() >= deadline or self.unspilled > self.SPILL_HIGH:
+                break
+
+            entry = self.backlog.popleft()
+            if isinstance(entry, str):
+                self.put_line(entry)
+                continue
+            chunks = [entry]
+            size = len(entry)
+            while (
+                self.backlog
+                and isinstance(self.backlog[0], bytes)
+                and size < self.MERGE_SIZE
+            ):
+                chunks.append(self.backlog.popleft())
+                size += len(chunks[-1])
+            self.backlog_size -= size
+            self.feed_text(self.decoder.decode(b"".join(chunks)))
+
+        if self.backlog_size <= self.LOW_WATER and self.unspilled <= self.SPILL_HIGH:
+            self.room.set()
+        if (
+            self.closing
+            and not self.backlog
+            and len(self.parsed) == len(self.lines)
+            and self.unspilled <= self.KEEP_LINES
+        ):
+            self.finish()
+
+    def close(self) -> None:
+        """Marks the end of the output; the buffer is `closed`
+        once everything queued before it has been merged"""
+
+        self.closing = True
+
+    def finish(self) -> None:
+        self.feed_text(self.decoder.decode(b"", final=True))
+        if self.line_count > 1 and not self.lines[-1]:
+            self.lines.pop()
+            self.dirty_from = min(self.dirty_from, self.line_count - 1)
+            del self.parsed[len(self.lines) :]
+            del self.end_styles[len(self.lines) :]
+        self.parse_lines(float("inf"))
+        if self.spilling:
+            self.spill(len(self.parsed), float("inf"))
+        self.closing = False
+        self.closed = True
+
+    def spill(self, count: int, deadline: float) -> None:
+        """Moves up to the first `count` parsed lines out to the spool,
+        a batch at a time until the deadline passes"""
+
+        if self.written:
+            # Lines move up by as many as are dropped
+            count -= self.written
+            self.drop_written()
+        if count <= 0:
+            return
+        if self.spool is None:
+            self.spool = Spool()
+        while self.written < count:
+            end = min(self.written + self.SPILL_BATCH, count)
+            start_styles = self.end_styles[max(self.written - 1, 0) : end - 1]
+            if not self.written:
+                start_styles.insert(0, self.carry_style)
+            self.spool.append(self.lines[self.written : end], start_styles)
+            self.written = end
+            if time.perf_counter() >= deadline:
+                break
+        if deadline == float("inf"):
+            self.drop_written()
+
+    def drop_written(self) -> None:
+        """Drops the lines written to the spool from memory"""
+
+        count = self.written
+        self.carry_style = self.end_styles[count - 1]
+        # In place, since a SpooledLines may be holding on to `parsed`
+        del self.lines[:count]
+        del self.parsed[:count]
+        del self.end_styles[:count]
+        self.spool.commit()
+        self.spilled += count
+        self.written = 0
+
+    def parse_lines(self, deadline: float) -> bool:
+        """Parses lines not parsed yet into spans until the deadline
+        passes, returning whether it got through all of them"""
+
+        style = self.end_styles[-1] if self.end_styles else self.carry_style
+        while len(self.parsed) < len(self.lines):
+            start = len(self.parsed)
+            for line in self.lines[start : start + self.PARSE_BATCH]:
+                spans, style = parse_line(line, style)
+                self.parsed.append(spans)
+                self.end_styles.append(style)
+            if time.perf_counter() >= deadline:
+                return len(self.parsed) == len(self.lines)
+        return True
+
+    def take_dirty(self) -> int | None:
+        """Returns the first line changed since the last call, if any"""
+
+        if self.dirty_from >= self.line_count:
+            return None
+        dirty_from = self.dirty_from
+        self.dirty_from = self.line_count
+        return dirty_from
+
+    @property
+    def line_count(self) -> int:
+        return self.spilled + len(self.lines)
+
+    @property
+    def spans(self) -> t.Sequence[tuple[Span, ...]]:
+        """Parsed lines by index, reading spilled ones back from the spool"""
+
+        if self.spool is None:
+            return self.parsed
+        return SpooledLines(self.spool, self.parsed)
+
+    @property
+    def text(self) -> str:
+        """The output as plain text, without escape sequences"""
+
+        return lines_text(self.spans)
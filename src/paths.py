@@ -0,0 +1,133 @@
+import bisect
+import collections
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from src.builtins import SHELL_CHARS
+from src.history import LAST_CHAR
+from src.shared import Shared
+from src.utils import sorted_in_runs
+
+# The path being typed at the end of the command line, spaces escaped
+# with a backslash staying in it
+if os.name == "nt":
+    LAST_TOKEN = re.compile(r"\S*$")
+else:
+    LAST_TOKEN = re.compile(r"(?:\\.|[^\s\\])*$")
+# Characters the shell would take for something else in a path
+ESCAPED = re.compile("([%s])" % re.escape("".join(SHELL_CHARS - {"\n"}) + " \t'\"\\"))
+
+
+class DirectoryCache:
+    """Listings of directories for path completion, sorted so the names
+    starting with what's typed sit together and bisect finds them, with
+    a slash after those of directories.
+
+    A listing is taken again only once the directory's mtime moved on,
+    which adding, removing or renaming anything in it does, so completing
+    in a huge directory doesn't list it on every Tab. One taken too soon
+    after the mtime to trust it is taken once more when that's past,
+    in case a change didn't move the mtime. Listing runs on a
+    thread, and until it's done completion goes by the listing from
+    before, if there is one.
+    """
+
+    MAX_DIRECTORIES = 64
+    SORT_RUN = 16384
+    # A change within this long of the mtime read might not have moved it
+    RACY_NS = 2 * 10**9
+
+    def __init__(self) -> None:
+        self.shared = Shared()
+        # Directories' mtime when listed, whether that was racy, and names
+        self.listings: collections.OrderedDict[
+            Path, tuple[int, bool, list[str]]
+        ] = collections.OrderedDict()
+        self.listing: set[Path] = set()
+        self.lock = threading.Lock()
+        # Goes up with each listing that changed, so completions redo themselves
+        self.version = 0
+
+    def warm(self, directory: Path):
+        """Lists the directory on a thread, unless that's done already"""
+
+        self.get(directory)
+
+    def get(self, directory: Path) -> list[str] | None:
+        """The directory's listing as cached, taking it again on a
+        thread when it's missing or the directory changed since"""
+
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        with self.lock:
+            cached = self.listings.get(directory)
+            if cached is not None:
+                self.listings.move_to_end(directory)
+            if (
+                cached is None
+                or cached[0] != mtime
+                or (cached[1] and time.time_ns() - mtime >= self.RACY_NS)
+            ) and directory not in self.listing:
+                self.listing.add(directory)
+                threading.Thread(
+                    target=self.list, args=(directory, mtime), daemon=True
+                ).start()
+        return None if cached is None else cached[2]
+
+    def list(self, directory: Path, mtime: int):
+        try:
+            with os.scandir(directory) as entries:
+                names = [
+                    entry.name + "/" if entry.is_dir() else entry.name
+                    for entry in entries
+                ]
+        except OSError:
+            names = []
+        names = sorted_in_runs(names, self.SORT_RUN)
+        # Could miss a change the mtime doesn't show, so it's taken again
+        racy = time.time_ns() - mtime < self.RACY_NS
+
+        with self.lock:
+            self.listing.discard(directory)
+            cached = self.listings.get(directory)
+            self.listings[directory] = (mtime, racy, names)
+            self.listings.move_to_end(directory)
+            while len(self.listings) > self.MAX_DIRECTORIES:
+                self.listings.popitem(last=False)
+            # Completions only need redoing when the names are new
+            if cached is not None and cached[2] == names:
+                return
+            self.version += 1
+        self.shared.scheduler.wake_from_thread()
+
+    def complete(self, command: str, cwd: Path) -> str | None:
+        """The command with the path at its end extended as far as every
+        name it could be agrees, or None when it can't be"""
+
+        token = LAST_TOKEN.search(command).group()
+        path = token if os.name == "nt" else re.sub(r"\\(.)", r"\1", token)
+        split = max(path.rfind("/"), path.rfind(os.sep)) + 1
+        head, prefix = path[:split], path[split:]
+        if not prefix:
+            return None
+        names = self.get(cwd / Path(head or ".").expanduser())
+        if not names:
+            return None
+
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_right(names, prefix + LAST_CHAR)
+        if start == end:
+            return None
+        # Sorted, so what the first and last share, all of them do
+        common = os.path.commonprefix((names[start], names[end - 1]))
+        if len(common) == len(prefix):
+            return None
+        rest = common[len(prefix) :]
+        if os.name != "nt":
+            rest = ESCAPED.sub(r"\\\1", rest)
+        return command + rest
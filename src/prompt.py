@@ -1,24 +1,192 @@
+import asyncio
 import itertools
-import re
-import subprocess
+import signal
+import time
+import typing as t
+from pathlib import Path
 
 import pygame
+import pyperclip
 
-from src.data import exact_match
+from src.ansi import PLAIN, Span, Style, resolve, slice_spans
+from src.glyphs import GlyphAtlas, GlyphLine, render_text, text_width, wrap_breaks
+from src.layout import LineLayout
+from src.output import OutputBuffer
+from src.screen import BLANK, Screen
 from src.shared import Shared
-from src.utils import Time, get_font, render_at
+from src.shell import SIGKILL, PtyProcess, signal_group
+from src.spool import lines_text
+from src.utils import Time, get_font
 
-SPECIAL_COMMANDS = ("exit", "cls", "clear", "cd")
+PTY_KEYS = {
+    pygame.K_RETURN: b"\r",
+    pygame.K_BACKSPACE: b"\x7f",
+    pygame.K_TAB: b"\t",
+    pygame.K_ESCAPE: b"\x1b",
+    pygame.K_UP: b"\x1b[A",
+    pygame.K_DOWN: b"\x1b[B",
+    pygame.K_RIGHT: b"\x1b[C",
+    pygame.K_LEFT: b"\x1b[D",
+    pygame.K_HOME: b"\x1b[H",
+    pygame.K_END: b"\x1b[F",
+    pygame.K_DELETE: b"\x1b[3~",
+    pygame.K_PAGEUP: b"\x1b[5~",
+    pygame.K_PAGEDOWN: b"\x1b[6~",
+}
 
 
-class Prompt:
+class PromptView:
+    """Drawing shared by live prompts and the records finished ones are
+    frozen into: the command line, then only the output lines in view"""
+
+    __slots__ = ()
     FONT_1 = get_font("assets/fonts/bold1.ttf", 16)
     FONT_2 = get_font("assets/fonts/regular1.ttf", 16)
 
+    @staticmethod
+    def label(cwd: Path, text: str) -> str:
+        return f"{cwd.name}  {text}"
+
+    def render_spans(self, spans: t.Sequence[Span]) -> pygame.Surface:
+        theme = self.shared.data.theme
+        if len(spans) == 1 and spans[0][1] == PLAIN:
+            return render_text(self.FONT_2, spans[0][0], theme["output-color"])
+
+        width = sum(text_width(text) for text, _ in spans)
+        surf = pygame.Surface(
+            (width * self.FONT_2.size(BLANK)[0], self.FONT_2.get_height()),
+            pygame.SRCALPHA,
+        )
+        x = 0
+        for text, style in spans:
+            style = Style._make(style)
+            fg, bg = resolve(style, theme)
+            atlas = GlyphAtlas.get(
+                self.FONT_1 if style.bold else self.FONT_2, fg, style.underline
+            )
+            if bg is not None:
+                surf.fill(bg, (x, 0, text_width(text) * atlas.cell_width, atlas.height))
+            x += atlas.draw(surf, text, (x, 0))
+        return surf
+
+    def columns(self) -> int:
+        """Columns output wraps at in the window as it is now"""
+
+        width = self.shared.screen.get_width() - 20
+        return max(width // self.FONT_2.size(BLANK)[0], 1)
+
+    @property
+    def line_count(self) -> int:
+        if self.screen is not None:
+            return len(self.screen.scrollback)
+        return len(self.spans)
+
+    @property
+    def row_count(self) -> int:
+        return self.layout.rows(self.line_count)
+
+    @property
+    def height(self) -> int:
+        """Height of the command line and everything below it"""
+
+        height = self.FONT_1.get_height() + self.row_count * self.FONT_2.get_height()
+        if self.screen is not None:
+            height += self.screen.used_rows() * self.FONT_2.get_height()
+        return height
+
+    def line_spans(self, index: int) -> t.Sequence[Span]:
+        if self.screen is not None:
+            return ((self.screen.scrollback[index], PLAIN),)
+        return self.spans[index]
+
+    def line_breaks(self, index: int) -> tuple[int, ...]:
+        spans = self.line_spans(index)
+        if len(spans) == 1:
+            return wrap_breaks(spans[0][0], self.layout.cols)
+        return wrap_breaks("".join(text for text, _ in spans), self.layout.cols)
+
+    def render_row(self, index: int, row: int) -> pygame.Surface:
+        """Renders one row of a line as wrapped at the layout's width"""
+
+        spans = self.line_spans(index)
+        breaks = self.line_breaks(index)
+        if breaks:
+            bounds = (0, *breaks, sum(len(text) for text, _ in spans))
+            spans = slice_spans(spans, bounds[row], bounds[row + 1])
+        return self.render_spans(spans)
+
+    def draw_lines(self, x: int, y: int) -> list[tuple[int, int]]:
+        """Draws the rows of output that intersect the window, returning
+        which rows of which lines those were. Lines in view that the
+        layout hasn't counted yet are still drawn with all their rows."""
+
+        line_height = self.FONT_2.get_height()
+        first = max(0, -y // line_height)
+        last = (self.shared.screen.get_height() - y) // line_height + 1
+        index, row = self.layout.line_at(first)
+        drawn = []
+        while first < last and index < self.line_count:
+            rows = len(self.line_breaks(index)) + 1
+            while row < rows and first < last:
+                self.shared.screen.blit(
+                    self.get_row_surf(index, row), (x, y + first * line_height)
+                )
+                drawn.append((index, row))
+                first += 1
+                row += 1
+            index += 1
+            row = 0
+        return drawn
+
+    def compose(self) -> pygame.Surface:
+        line_height = self.FONT_2.get_height()
+        self.layout.count(self, float("inf"))
+        rows = [
+            self.render_row(index, row)
+            for index in range(self.line_count)
+            for row in range(len(self.line_breaks(index)) + 1)
+        ]
+        width = max([self.surf.get_width()] + [row.get_width() for row in rows])
+        surf = pygame.Surface((width, self.height), pygame.SRCALPHA)
+        surf.blit(self.surf, (0, 0))
+        for index, row in enumerate(rows):
+            surf.blit(row, (0, self.FONT_1.get_height() + index * line_height))
+        return surf
+
+    def forget_surfaces(self):
+        """Drops what was rendered for drawing, once out of view"""
+
+    def draw(self, offset):
+        self.region.update(
+            10,
+            10 + offset,
+            self.shared.screen.get_width() - 20,
+            self.FONT_1.get_height(),
+        )
+        self.form_surface()
+        if self.finished and self.height <= self.shared.screen.get_height():
+            self.shared.screen.blit(self.get_composed(), self.region.topleft)
+            return
+
+        x, y = self.region.topleft
+        if self.sim_surf is not None:
+            self.shared.screen.blit(self.sim_surf, (x, y))
+        self.shared.screen.blit(self.surf, (x, y))
+        y += self.FONT_1.get_height()
+        self.draw_lines(x, y)
+        if self.screen_surf is not None:
+            self.draw_screen(x, y + self.row_count * self.FONT_2.get_height())
+
+
+class Prompt(PromptView):
+    KILL_GRACE = 2.0
+    # Keys the surfaces of a prompt's record in the shared cache
+    uids = itertools.count()
+
     def __init__(self) -> None:
         self.shared = Shared()
-        self.full_surf = pygame.Surface(
-            (self.shared.screen.get_width(), self.FONT_1.get_height()), pygame.SRCALPHA
+        self.region = pygame.Rect(
+            10, 10, self.shared.screen.get_width() - 20, self.FONT_1.get_height()
         )
         self.released = False
         self.text = []
@@ -28,12 +196,40 @@ class Prompt:
         self.del_timer = Time(0.1)
         self.start = False
         self.focused = True
-        self.output_surf: None | pygame.Surface = None
-        self.output: None | str = None
-        self.executable = "pwsh"
+        self.running = False
+        self.finished = False
+        self.task: asyncio.Task | None = None
+        self.uid = next(self.uids)
+        self.glyph_line = GlyphLine()
+        self.layout = LineLayout(self.columns())
+        self.output_buffer = OutputBuffer(self.shared.data.config["spool-threshold"])
+        # Only the rows currently in view, by line index and row
+        self.line_surfs: dict[tuple[int, int], pygame.Surface] = {}
+        self.lines_theme: dict | None = None
+        self.lines_cols = self.layout.cols
+        # A finished prompt that fits in the window is drawn as one surface
+        self.composed: pygame.Surface | None = None
+        self.composed_key: tuple | None = None
+        self.exit_code: int | None = None
+        self.started: float | None = None
+        self.duration: float | None = None
+        self.builtin: str | None = None
+        self.termination: str | None = None
+        self.status = ""
+        self.batch: list[str] = []
+        self.timers: list[asyncio.TimerHandle] = []
+        self.pooled_process: asyncio.subprocess.Process | None = None
+        self.cwd: Path = self.shared.cwd
+        self.end_cwd: Path | None = None
+        self.pty: PtyProcess | None = None
+        self.screen: Screen | None = None
+        self.screen_surf: pygame.Surface | None = None
+        self.executable = self.shared.data.config["shell"]
         self.command = ""
         self.sim_surf: pygame.Surface | None = None
         self.suggestion: str | None = None
+        self.suggested_for: tuple | None = None
+        self.surface_key: tuple | None = None
         self.form_surface()
 
     def remove_last_char(self):
@@ -52,6 +248,8 @@ class Prompt:
                     self.remove_last_char()
                     self.start = True
                     self.del_timer.reset()
+                elif event.key == pygame.K_v and event.mod & pygame.KMOD_CTRL:
+                    self.on_paste()
             elif event.type == pygame.KEYUP:
                 if event.key == pygame.K_BACKSPACE:
                     self.start = False
@@ -60,55 +258,336 @@ class Prompt:
             self.blinky_cursor = "|"
             if self.del_timer.tick():
                 self.remove_last_char()
+            self.shared.scheduler.request(self.del_timer.deadline)
+        self.command = "".join(self.text)
+
+    def on_paste(self):
+        """Pasting several lines submits each complete line as its own job"""
+
+        lines = pyperclip.paste().replace("\r\n", "\n").split("\n")
+        self.text.extend(lines[0])
+        if len(lines) == 1:
+            return
+        self.batch = lines[1:]
         self.command = "".join(self.text)
+        self.submit()
 
     def on_delete_line(self):
         if self.shared.keys[pygame.K_x] and self.shared.keys[pygame.K_LCTRL]:
             self.text.clear()
 
-    def cleanse_output(self):
-        self.output = re.sub(r"\x1b\[([0-9]{1,2}(;[0-9]{1,2})?)?[m|K]", "", self.output)
+    def exit_message(self, code: int) -> str:
+        if self.termination is not None:
+            return f"Command '{self.command}' {self.termination}"
+        return f"Command '{self.command}' returned non-zero exit status {code}"
 
-    def gain_output(self):
-        if self.command.strip() in SPECIAL_COMMANDS or "cd" in self.command:
-            self.output = ""
+    def signal(self, sig: int):
+        if self.pty is not None:
+            signal_group(self.pty.process, sig)
+        elif self.pooled_process is not None:
+            signal_group(self.pooled_process, sig)
+        else:
+            self.shared.session.signal_jobs(sig)
+
+    def cancel(self, reason: str):
+        """Interrupts the running command, killing it if it
+        still hasn't exited once the grace period is over"""
+
+        if self.finished or self.termination is not None:
+            return
+        self.termination = reason
+        if not self.running:
+            # Still queued, so it gets dropped once its turn comes
+            return
+        self.signal(signal.SIGINT)
+        self.timers.append(
+            asyncio.get_running_loop().call_later(self.KILL_GRACE, self.kill)
+        )
+
+    def kill(self):
+        if not self.running:
+            return
+        if not self.termination.endswith(", then killed"):
+            self.termination += ", then killed"
+        self.signal(SIGKILL)
+        # A loop in the session only loses the job that was killed
+        self.timers.append(
+            asyncio.get_running_loop().call_later(self.KILL_GRACE, self.kill)
+        )
+
+    def on_interrupt(self):
+        # Programs on a pty get the keystroke itself, like any terminal
+        if self.screen is not None:
             return
+        for event in self.shared.events:
+            if (
+                event.type == pygame.KEYDOWN
+                and event.key == pygame.K_c
+                and event.mod & pygame.KMOD_CTRL
+            ):
+                self.cancel("was interrupted")
+
+    @property
+    def use_pty(self) -> bool:
+        return self.shared.data.config["pty"] and PtyProcess.available
+
+    def screen_size(self) -> tuple[int, int]:
+        cell_width, cell_height = self.FONT_2.size(BLANK)
+        width, height = self.shared.screen.get_size()
+        return (
+            max((width - 20) // cell_width, 1),
+            max((height - 20 - self.FONT_1.get_height()) // cell_height, 1),
+        )
+
+    async def run_on_pty(self):
+        cols, rows = self.screen_size()
+        self.screen = Screen(cols, rows)
+        self.pty = PtyProcess(self.executable, cols, rows)
+        return await self.pty.run(self.command, self.cwd, self.on_screen_output)
+
+    def on_screen_output(self, data: bytes):
+        self.screen.feed(data)
+        self.shared.scheduler.wake()
+
+    def on_output(self, data: bytes):
+        self.output_buffer.feed(data)
+        self.shared.scheduler.wake()
+
+    def run_builtin(self, tokens: list[str]):
+        self.builtin = tokens[0]
+        output, self.exit_code, self.end_cwd = self.shared.builtins.run(tokens)
+        self.output_buffer.feed_text(output)
+
+    async def run_isolated(self):
+        self.pooled_process = await self.shared.pool.acquire(self.cwd)
+        return await self.shared.pool.run(
+            self.pooled_process,
+            self.command,
+            self.cwd,
+            self.on_output,
+            self.output_buffer.drain,
+        )
+
+    async def run_in_session(self):
+        return await self.shared.session.run(
+            self.command, self.cwd, self.on_output, self.output_buffer.drain
+        )
+
+    async def gain_output(self):
+        """Runs the command without blocking the frame loop,
+        streaming its output into the buffer as it arrives"""
+
+        self.running = True
+        self.started = time.time()
+        self.cwd = self.shared.cwd
+        self.form_surface()
+        if self.termination is not None:
+            self.output_buffer.feed_line(self.exit_message(0))
+            self.on_exit()
+            return
+        tokens = self.shared.builtins.parse(self.command)
+        if tokens is not None:
+            self.run_builtin(tokens)
+            self.on_exit()
+            return
+        timeout = self.shared.data.config["command-timeout"]
+        if timeout:
+            self.timers.append(
+                asyncio.get_running_loop().call_later(
+                    timeout, self.cancel, f"timed out after {timeout}s"
+                )
+            )
         try:
-            self.output = subprocess.check_output(
-                [self.executable, "-Command", self.command],
-                shell=True,
-                universal_newlines=True,
-                cwd=self.shared.cwd,
+            if self.use_pty:
+                self.exit_code, self.end_cwd = await self.run_on_pty()
+            elif self.shared.data.config["isolate-commands"]:
+                self.exit_code, self.end_cwd = await self.run_isolated()
+            else:
+                self.exit_code, self.end_cwd = await self.run_in_session()
+        except OSError:
+            self.exit_code = 1
+        self.flush_screen()
+        if self.exit_code or self.termination is not None:
+            self.output_buffer.feed_line(self.exit_message(self.exit_code))
+        self.on_exit()
+
+    def merge_output(self, deadline: float):
+        """Merges queued output into lines, leaving whatever
+        doesn't fit before the deadline for the next frame"""
+
+        self.output_buffer.merge(deadline)
+        start = self.output_buffer.take_dirty()
+        if start is not None:
+            for key in [key for key in self.line_surfs if key[0] >= start]:
+                del self.line_surfs[key]
+            self.layout.truncate(start)
+            # The output can grow, pushing down whatever follows
+            self.shared.damage.below(self.region.top)
+        if (
+            not self.layout.count(self, deadline)
+            or self.output_buffer.backlog
+            or self.output_buffer.closing
+        ):
+            # Left over for the next frame, which mustn't wait for input
+            self.shared.scheduler.request()
+
+        if self.output_buffer.closed:
+            self.on_finish()
+        elif self.get_status() != self.status:
+            self.form_surface()
+
+    def render_screen(self):
+        """Renders the cells of the screen that changed since the last frame"""
+
+        atlas = GlyphAtlas.get(self.FONT_2, self.shared.data.theme["output-color"])
+        cell_width, cell_height = self.FONT_2.size(BLANK)
+        size = (self.screen.cols * cell_width, self.screen.rows * cell_height)
+        if self.screen_surf is None or self.screen_surf.get_size() != size:
+            self.screen_surf = pygame.Surface(size, pygame.SRCALPHA)
+
+        dirty = self.screen.take_dirty()
+        if dirty:
+            self.shared.damage.below(self.region.top)
+        cells = []
+        for row, col in dirty:
+            cell = pygame.Rect(
+                col * cell_width, row * cell_height, cell_width, cell_height
             )
-        except Exception as e:
-            self.output = f"Command '{self.command}' returned non-zero exit status 1"
+            self.screen_surf.fill((0, 0, 0, 0), cell)
+            char = self.screen.grid[row][col]
+            if char != BLANK:
+                cells.append((atlas.glyph(char, 1), cell.topleft))
+        self.screen_surf.fblits(cells)
 
-    def on_enter(self, event):
-        if event.key != pygame.K_RETURN:
+    def forward_input(self):
+        """Sends keystrokes to the program running on the pty"""
+
+        for event in self.shared.events:
+            if event.type == pygame.TEXTINPUT:
+                self.pty.write(event.text.encode())
+            elif event.type != pygame.KEYDOWN:
+                continue
+            elif event.mod & pygame.KMOD_CTRL and pygame.K_a <= event.key <= pygame.K_z:
+                self.pty.write(bytes((event.key - pygame.K_a + 1,)))
+            elif event.key in PTY_KEYS:
+                self.pty.write(PTY_KEYS[event.key])
+
+    def on_win_resize(self):
+        if self.screen is None or not self.running:
+            return
+        cols, rows = self.screen_size()
+        self.screen.resize(cols, rows)
+        self.pty.resize(cols, rows)
+
+    def flush_screen(self):
+        """Turns what the pty program left on screen into regular output"""
+
+        if self.screen is None:
+            return
+        self.output_buffer.feed_text(self.screen.text())
+        self.screen = None
+        self.screen_surf = None
+        self.line_surfs.clear()
+        self.layout.truncate(0)
+
+    def get_row_surf(self, index: int, row: int) -> pygame.Surface:
+        surf = self.line_surfs.get((index, row))
+        if surf is None:
+            surf = self.line_surfs[index, row] = self.render_row(index, row)
+        return surf
+
+    def draw_lines(self, x: int, y: int) -> list[tuple[int, int]]:
+        """Also drops the surfaces of rows that scrolled out of view,
+        as the output they show may still change"""
+
+        drawn = super().draw_lines(x, y)
+        visible = set(drawn)
+        for key in [key for key in self.line_surfs if key not in visible]:
+            del self.line_surfs[key]
+        return drawn
+
+    def get_composed(self) -> pygame.Surface:
+        key = (self.surface_key, self.shared.screen.get_width())
+        if self.composed is None or key != self.composed_key:
+            self.composed = self.compose()
+            self.composed_key = key
+        return self.composed
+
+    def forget_surfaces(self):
+        self.composed = None
+        self.line_surfs.clear()
+
+    def draw(self, offset):
+        # Rows rendered for another theme, or wrapped at another width
+        if (
+            self.lines_theme is not self.shared.data.theme
+            or self.lines_cols != self.layout.cols
+        ):
+            self.lines_theme = self.shared.data.theme
+            self.lines_cols = self.layout.cols
+            self.line_surfs.clear()
+        super().draw(offset)
+
+    def on_exit(self):
+        """The command is done, though its output may still be merging"""
+
+        for timer in self.timers:
+            timer.cancel()
+        self.flush_screen()
+        self.output_buffer.close()
+        self.running = False
+        self.duration = time.time() - self.started
+        self.change_directory()
+        self.shared.scheduler.wake()
+
+    @property
+    def spans(self) -> t.Sequence[tuple[Span, ...]]:
+        return self.output_buffer.spans
+
+    @property
+    def output(self) -> str | None:
+        """Plain text of the output, joined only when asked for"""
+
+        if not self.finished:
+            return None
+        return self.output_buffer.text
+
+    def on_finish(self):
+        self.finished = True
+        self.form_surface()
+
+    def change_directory(self):
+        """Moves the terminal to where the command left off, so
+        jobs started after this one spawn there"""
+
+        if self.end_cwd is None or self.end_cwd == self.cwd:
             return
+        self.shared.previous_cwd = self.shared.cwd
+        self.shared.cwd = self.end_cwd
+        self.shared.paths.warm(self.shared.cwd)
+        # Warm shells waiting in the new directory for the next command
+        if self.shared.data.config["isolate-commands"]:
+            self.shared.pool.retarget(self.shared.cwd)
+            self.shared.pool.refill()
+
+    def submit(self):
+        """Queues the command to run as soon as the job queue allows"""
 
         self.focused = False
-        self.gain_output()
-        self.cleanse_output()
-        self.output_surf = self.FONT_2.render(
-            self.output,
-            True,
-            self.shared.data.theme["output-color"],
-        )
-        self.full_surf = pygame.Surface(
-            (
-                Shared.SCREEN_WIDTH,
-                self.FONT_1.get_height() + self.output_surf.get_height(),
-            )
-        )
         self.released = True
+        exclusive = self.use_pty or self.shared.builtins.parse(self.command) is not None
+        in_session = not exclusive and not self.shared.data.config["isolate-commands"]
+        self.task = self.shared.jobs.submit(self.gain_output, exclusive, in_session)
         self.form_surface()
 
+    def on_enter(self, event):
+        if event.key != pygame.K_RETURN:
+            return
+
+        self.submit()
+
     def on_fetch_command(self, key: int):
-        if key == pygame.K_UP:
-            self.shared.data.current_index -= 1
-        else:
-            self.shared.data.current_index += 1
+        self.shared.data.step_history(-1 if key == pygame.K_UP else 1)
 
         self.text = list(self.shared.data.current_line)
 
@@ -124,23 +603,52 @@ class Prompt:
             return
         if self.timer.tick():
             self.blinky_cursor = next(self.blink_cursors)
+        self.shared.scheduler.request(self.timer.deadline)
+
+    def get_status(self) -> str:
+        if not self.released or self.finished:
+            return ""
+        if not self.running and not self.output_buffer.closing:
+            return "  (queued)"
+        behind = self.output_buffer.backlog_size
+        if behind:
+            # Output arrives faster than it can be shown
+            return f"  (running, {behind / 1024:.0f} KiB behind)"
+        return "  (running)"
 
     def form_surface(self):
+        """Renders the command line, unless nothing shown on it changed"""
+
+        cwd = self.cwd if self.released else self.shared.cwd
         if self.released:
             self.blinky_cursor = ""
-        self.surf = self.FONT_1.render(
-            f"{self.shared.cwd.name}  {self.command}{self.blinky_cursor}",
-            True,
-            self.shared.data.theme["text-color"],
+        self.status = self.get_status()
+        key = (
+            cwd.name,
+            self.command,
+            self.blinky_cursor,
+            self.status,
+            self.suggestion,
+            self.shared.data.theme,
+        )
+        if key == self.surface_key:
+            return
+        self.surface_key = key
+        self.shared.damage.add(
+            (0, self.region.top, self.shared.screen.get_width(), self.region.height)
+        )
+
+        self.surf = self.glyph_line.render(
+            GlyphAtlas.get(self.FONT_1, self.shared.data.theme["text-color"]),
+            self.label(cwd, self.command) + self.blinky_cursor + self.status,
         )
-        self.region = self.full_surf.get_rect(topleft=(10, 10))
 
         if self.suggestion is None or not self.command:
             self.sim_surf = None
             return
-        self.sim_surf = self.FONT_1.render(
-            f"{self.shared.cwd.name}  {self.suggestion}",
-            True,
+        self.sim_surf = render_text(
+            self.FONT_1,
+            self.label(cwd, self.suggestion),
             self.shared.data.theme["suggestion-color"],
         )
         self.sim_surf.set_alpha(150)
@@ -149,7 +657,7 @@ class Prompt:
         if not self.shared.clicked:
             return
 
-        if self.region.inflate(self.shared.SCREEN_WIDTH, 0).collidepoint(
+        if self.region.inflate(self.shared.screen.get_width(), 0).collidepoint(
             self.shared.mouse_pos
         ):
             self.focused = True
@@ -157,9 +665,17 @@ class Prompt:
             self.focused = False
 
     def get_suggestion(self):
-        self.suggestion = exact_match(self.shared.data.command_history, self.command)
-        if self.suggestion is None:
+        """Looks up the suggestion again only once the text changed, or
+        a directory listing came in. Commands from the history come
+        first, then completing the path being typed."""
+
+        key = (self.command, self.shared.cwd, self.shared.paths.version)
+        if key == self.suggested_for:
             return
+        self.suggested_for = key
+        self.suggestion = self.shared.data.suggest(self.command, self.shared.cwd)
+        if self.suggestion is None:
+            self.suggestion = self.shared.paths.complete(self.command, self.shared.cwd)
 
     def on_autocomplete(self, event):
         if event.key in (pygame.K_TAB, pygame.K_RIGHT) and self.suggestion is not None:
@@ -172,7 +688,15 @@ class Prompt:
                 self.on_fetch_command_check(event)
                 self.on_enter(event)
 
-    def update(self):
+    def update(self, deadline: float):
+        if self.released:
+            self.on_interrupt()
+            if self.screen is not None:
+                self.forward_input()
+                self.render_screen()
+            else:
+                self.merge_output(deadline)
+            return
         self.blink_cursor()
         self.get_input()
         self.get_suggestion()
@@ -182,17 +706,95 @@ class Prompt:
 
         self.form_surface()
 
-    def draw(self, offset):
-        self.full_surf = pygame.Surface(self.full_surf.get_size(), pygame.SRCALPHA)
-        if self.sim_surf is not None:
-            render_at(self.full_surf, self.sim_surf, "topleft")
-        render_at(self.full_surf, self.surf, "topleft")
-        if self.output_surf is not None:
-            render_at(
-                self.full_surf,
-                self.output_surf,
-                "topleft",
-                (0, self.FONT_1.get_height()),
+    def draw_screen(self, x: int, y: int):
+        cell_width, cell_height = self.FONT_2.size(BLANK)
+        area = pygame.Rect(
+            0, 0, self.screen_surf.get_width(), self.screen.used_rows() * cell_height
+        )
+        self.shared.screen.blit(self.screen_surf, (x, y), area)
+        if self.screen.cursor_visible:
+            cursor = pygame.Rect(
+                x + self.screen.x * cell_width,
+                y + self.screen.y * cell_height,
+                cell_width,
+                cell_height,
+            )
+            pygame.draw.rect(
+                self.shared.screen, self.shared.data.theme["output-color"], cursor, 1
             )
-        self.region.topleft = (10, 10 + offset)
-        self.shared.screen.blit(self.full_surf, self.region.topleft)
+
+
+class PromptRecord(PromptView):
+    """A finished prompt frozen down to what it takes to draw it again
+    and copy its output. Its surfaces live in the shared surface cache,
+    which keeps the recently drawn ones within its budget."""
+
+    __slots__ = (
+        "uid",
+        "command",
+        "cwd",
+        "spans",
+        "exit_code",
+        "started",
+        "duration",
+        "region",
+        "layout",
+    )
+    shared = Shared()
+    finished = True
+    screen = None
+    screen_surf = None
+    sim_surf = None
+
+    def __init__(self, prompt: Prompt) -> None:
+        self.uid = prompt.uid
+        self.command = prompt.command
+        self.cwd = prompt.cwd
+        self.spans = prompt.spans
+        self.exit_code = prompt.exit_code
+        self.started = prompt.started
+        self.duration = prompt.duration
+        self.region = prompt.region
+        self.layout = prompt.layout
+
+    @property
+    def output(self) -> str:
+        return lines_text(self.spans)
+
+    def cached(
+        self, part: tuple | str, render: t.Callable[[], pygame.Surface]
+    ) -> pygame.Surface:
+        """A surface for part of this prompt from the shared cache,
+        rendered on a miss for the current theme and window width"""
+
+        key = (
+            self.uid,
+            part,
+            id(self.shared.data.theme),
+            self.shared.screen.get_width(),
+        )
+        surf = self.shared.surfaces.get(key)
+        if surf is None:
+            surf = render()
+            self.shared.surfaces.put(key, surf)
+        return surf
+
+    @property
+    def surf(self) -> pygame.Surface:
+        return self.cached(
+            "label",
+            lambda: render_text(
+                self.FONT_1,
+                self.label(self.cwd, self.command),
+                self.shared.data.theme["text-color"],
+            ),
+        )
+
+    def get_row_surf(self, index: int, row: int) -> pygame.Surface:
+        return self.cached((index, row), lambda: self.render_row(index, row))
+
+    def get_composed(self) -> pygame.Surface:
+        return self.cached("composed", self.compose)
+
+    def form_surface(self):
+        pass
@@ -0,0 +1,90 @@
+import asyncio
+import math
+import time
+
+import pygame
+
+
+class FrameScheduler:
+    """Decides when the next frame runs. Instead of redrawing as fast as
+    it can, the loop sleeps until something needs a frame: an input event,
+    output from a command (`wake`), or a deadline asked for with `request`,
+    like the cursor's next blink. Deadlines only hold for the frame after
+    the one that asked, so whatever still needs frames asks every frame.
+
+    Frames never come closer together than `max_fps` allows.
+    """
+
+    # While jobs run the loop can't block in pygame, as they run on it,
+    # so input is looked for this often instead
+    INPUT_POLL = 0.01
+    # Posted by other threads, as pygame's queue is looked at either way
+    # the loop waits
+    WAKE_EVENT = pygame.event.custom_type()
+
+    def __init__(self, max_fps: int) -> None:
+        self.frame_time = 1 / max_fps if max_fps > 0 else 0.0
+        self.last_frame = 0.0
+        self.deadline: float | None = None
+        # Events taken off the queue while waiting, handed to the next frame
+        self.events: list[pygame.event.Event] = []
+        self.woken = asyncio.Event()
+
+    def request(self, deadline: float | None = None) -> None:
+        """Asks for a frame by `deadline`, a `time.perf_counter` value,
+        or as soon as the frame cap allows"""
+
+        if deadline is None:
+            deadline = 0.0
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+
+    def wake(self) -> None:
+        """Asks for a frame from outside the loop, like when output arrives"""
+
+        self.woken.set()
+
+    def wake_from_thread(self) -> None:
+        """Asks for a frame from a thread other than the loop's"""
+
+        pygame.event.post(pygame.event.Event(self.WAKE_EVENT))
+
+    def take_events(self) -> list[pygame.event.Event]:
+        events = self.events + pygame.event.get()
+        self.events = []
+        return events
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.events) or self.woken.is_set() or pygame.event.peek()
+
+    async def wait(self) -> None:
+        while not self.pending:
+            now = time.perf_counter()
+            if self.deadline is not None and now >= self.deadline:
+                break
+            timeout = None if self.deadline is None else self.deadline - now
+            if len(asyncio.all_tasks()) > 1:
+                timeout = min(timeout or self.INPUT_POLL, self.INPUT_POLL)
+                try:
+                    await asyncio.wait_for(self.woken.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                self.wait_event(timeout)
+
+        delay = self.last_frame + self.frame_time - time.perf_counter()
+        await asyncio.sleep(max(delay, 0))
+        self.woken.clear()
+        self.deadline = None
+        self.last_frame = time.perf_counter()
+
+    def wait_event(self, timeout: float | None) -> None:
+        """Blocks in pygame until an event comes or `timeout` runs out"""
+
+        if timeout is None:
+            event = pygame.event.wait()
+        else:
+            event = pygame.event.wait(max(math.ceil(timeout * 1000), 1))
+        if event.type != pygame.NOEVENT:
+            self.events.append(event)
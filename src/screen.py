@@ -0,0 +1,355 @@
+import codecs
+
+BLANK = " "
+TAB_WIDTH = 8
+ALT_SCREEN_MODES = ("47", "1047", "1049")
+
+
+class Screen:
+    """Cell grid for programs running on a pseudo-terminal.
+
+    Follows the VT100/xterm sequences that move the cursor, erase,
+    scroll (within a scroll region) and switch to the alternate screen.
+    Every cell written to is recorded in `dirty` so only those get redrawn.
+    """
+
+    def __init__(self, cols: int, rows: int) -> None:
+        self.cols = cols
+        self.rows = rows
+        self.main = self.blank_grid()
+        self.grid = self.main
+        self.alternate = False
+        self.scrollback: list[str] = []
+        self.x = self.y = 0
+        self.saved_cursor = (0, 0)
+        self.top, self.bottom = 0, rows - 1
+        self.wrap_pending = False
+        self.cursor_visible = True
+        self.dirty: set[tuple[int, int]] = set()
+        self.mark_all_dirty()
+
+        self.state = self.on_ground
+        self.params = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def blank_row(self) -> list[str]:
+        return [BLANK] * self.cols
+
+    def blank_grid(self) -> list[list[str]]:
+        return [self.blank_row() for _ in range(self.rows)]
+
+    def mark_rows_dirty(self, start: int, end: int):
+        for row in range(start, end + 1):
+            self.dirty.update((row, col) for col in range(self.cols))
+
+    def mark_all_dirty(self):
+        self.mark_rows_dirty(0, self.rows - 1)
+
+    def take_dirty(self) -> set[tuple[int, int]]:
+        dirty = self.dirty
+        self.dirty = set()
+        return dirty
+
+    def put(self, char: str):
+        if self.wrap_pending:
+            self.x = 0
+            self.line_feed()
+        self.grid[self.y][self.x] = char
+        self.dirty.add((self.y, self.x))
+        if self.x == self.cols - 1:
+            self.wrap_pending = True
+        else:
+            self.x += 1
+
+    def line_feed(self):
+        self.wrap_pending = False
+        if self.y == self.bottom:
+            self.scroll_up(1)
+        elif self.y < self.rows - 1:
+            self.y += 1
+
+    def reverse_index(self):
+        if self.y == self.top:
+            self.scroll_down(1)
+        elif self.y > 0:
+            self.y -= 1
+
+    def scroll_up(self, n: int):
+        for _ in range(min(n, self.bottom - self.top + 1)):
+            row = self.grid.pop(self.top)
+            if not self.alternate and self.top == 0:
+                self.scrollback.append("".join(row).rstrip())
+            self.grid.insert(self.bottom, self.blank_row())
+        self.mark_rows_dirty(self.top, self.bottom)
+
+    def scroll_down(self, n: int):
+        for _ in range(min(n, self.bottom - self.top + 1)):
+            self.grid.pop(self.bottom)
+            self.grid.insert(self.top, self.blank_row())
+        self.mark_rows_dirty(self.top, self.bottom)
+
+    def erase(self, row: int, start: int, end: int):
+        for col in range(start, min(end, self.cols)):
+            self.grid[row][col] = BLANK
+            self.dirty.add((row, col))
+
+    def erase_display(self, mode: int):
+        if mode == 0:
+            self.erase(self.y, self.x, self.cols)
+            rows = range(self.y + 1, self.rows)
+        elif mode == 1:
+            self.erase(self.y, 0, self.x + 1)
+            rows = range(self.y)
+        else:
+            rows = range(self.rows)
+        for row in rows:
+            self.erase(row, 0, self.cols)
+
+    def erase_line(self, mode: int):
+        if mode == 0:
+            self.erase(self.y, self.x, self.cols)
+        elif mode == 1:
+            self.erase(self.y, 0, self.x + 1)
+        else:
+            self.erase(self.y, 0, self.cols)
+
+    def insert_lines(self, n: int):
+        if not self.top <= self.y <= self.bottom:
+            return
+        for _ in range(min(n, self.bottom - self.y + 1)):
+            self.grid.pop(self.bottom)
+            self.grid.insert(self.y, self.blank_row())
+        self.mark_rows_dirty(self.y, self.bottom)
+
+    def delete_lines(self, n: int):
+        if not self.top <= self.y <= self.bottom:
+            return
+        for _ in range(min(n, self.bottom - self.y + 1)):
+            self.grid.pop(self.y)
+            self.grid.insert(self.bottom, self.blank_row())
+        self.mark_rows_dirty(self.y, self.bottom)
+
+    def insert_chars(self, n: int):
+        row = self.grid[self.y]
+        n = min(n, self.cols - self.x)
+        row[self.x : self.x] = [BLANK] * n
+        del row[self.cols :]
+        self.dirty.update((self.y, col) for col in range(self.x, self.cols))
+
+    def delete_chars(self, n: int):
+        row = self.grid[self.y]
+        n = min(n, self.cols - self.x)
+        del row[self.x : self.x + n]
+        row.extend([BLANK] * n)
+        self.dirty.update((self.y, col) for col in range(self.x, self.cols))
+
+    def move_to(self, row: int, col: int):
+        self.y = max(0, min(row, self.rows - 1))
+        self.x = max(0, min(col, self.cols - 1))
+        self.wrap_pending = False
+
+    def set_scroll_region(self, top: int, bottom: int):
+        bottom = min(bottom, self.rows) or self.rows
+        if top >= bottom:
+            return
+        self.top, self.bottom = max(top, 1) - 1, bottom - 1
+        self.move_to(0, 0)
+
+    def switch_screen(self, alternate: bool):
+        if alternate == self.alternate:
+            return
+        self.alternate = alternate
+        if alternate:
+            self.saved_cursor = (self.y, self.x)
+            self.grid = self.blank_grid()
+        else:
+            self.grid = self.main
+            self.move_to(*self.saved_cursor)
+        self.top, self.bottom = 0, self.rows - 1
+        self.mark_all_dirty()
+
+    def reset(self):
+        self.switch_screen(False)
+        self.main[:] = self.blank_grid()
+        self.top, self.bottom = 0, self.rows - 1
+        self.move_to(0, 0)
+        self.mark_all_dirty()
+
+    def resize(self, cols: int, rows: int):
+        cols, rows = max(cols, 1), max(rows, 1)
+        if (cols, rows) == (self.cols, self.rows):
+            return
+        grids = [self.main, self.grid] if self.alternate else [self.main]
+        for grid in grids:
+            for row in grid:
+                row[cols:] = []
+                row.extend([BLANK] * (cols - len(row)))
+            while len(grid) > rows:
+                # Keep the rows around the cursor, pushing the top ones out
+                if grid is self.main and self.y >= rows:
+                    self.scrollback.append("".join(grid.pop(0)).rstrip())
+                    self.y -= 1
+                else:
+                    grid.pop()
+            while len(grid) < rows:
+                grid.append([BLANK] * cols)
+
+        self.cols, self.rows = cols, rows
+        self.top, self.bottom = 0, rows - 1
+        self.move_to(self.y, self.x)
+        self.dirty = set()
+        self.mark_all_dirty()
+
+    def feed(self, data: bytes):
+        self.feed_text(self.decoder.decode(data))
+
+    def feed_text(self, text: str):
+        for char in text:
+            self.state(char)
+
+    def on_ground(self, char: str):
+        if char >= " " and char != "\x7f":
+            self.put(char)
+        elif char == "\x1b":
+            self.state = self.on_escape
+        elif char == "\r":
+            self.x = 0
+            self.wrap_pending = False
+        elif char in "\n\x0b\x0c":
+            self.line_feed()
+        elif char == "\b":
+            self.move_to(self.y, self.x - 1)
+        elif char == "\t":
+            self.move_to(self.y, (self.x // TAB_WIDTH + 1) * TAB_WIDTH)
+
+    def on_escape(self, char: str):
+        self.state = self.on_ground
+        if char == "[":
+            self.params = ""
+            self.state = self.on_csi
+        elif char == "]":
+            self.params = ""
+            self.state = self.on_osc
+        elif char in "()*+":
+            self.state = self.on_charset
+        elif char == "7":
+            self.saved_cursor = (self.y, self.x)
+        elif char == "8":
+            self.move_to(*self.saved_cursor)
+        elif char == "D":
+            self.line_feed()
+        elif char == "E":
+            self.x = 0
+            self.line_feed()
+        elif char == "M":
+            self.reverse_index()
+        elif char == "c":
+            self.reset()
+
+    def on_charset(self, char: str):
+        self.state = self.on_ground
+
+    def on_osc(self, char: str):
+        if char == "\x07":
+            self.state = self.on_ground
+        elif char == "\x1b":
+            self.state = self.on_osc_escape
+        else:
+            self.params += char
+
+    def on_osc_escape(self, char: str):
+        # ESC \ (string terminator) ends the OSC
+        self.state = self.on_ground
+        if char != "\\":
+            self.on_escape(char)
+
+    def on_csi(self, char: str):
+        if "\x40" <= char <= "\x7e":
+            self.state = self.on_ground
+            self.dispatch_csi(char, self.params)
+        elif char == "\x1b":
+            self.state = self.on_escape
+        else:
+            self.params += char
+
+    def dispatch_csi(self, final: str, params: str):
+        private = params.startswith("?")
+        values = [
+            int(value) if value.isdigit() else 0
+            for value in params.lstrip("?>=").split(";")
+        ]
+        n = max(values[0], 1)
+
+        if private:
+            if final in "hl":
+                self.set_private_modes(params[1:].split(";"), final == "h")
+        elif final == "A":
+            self.move_to(self.y - n, self.x)
+        elif final in "Be":
+            self.move_to(self.y + n, self.x)
+        elif final in "Ca":
+            self.move_to(self.y, self.x + n)
+        elif final == "D":
+            self.move_to(self.y, self.x - n)
+        elif final == "E":
+            self.move_to(self.y + n, 0)
+        elif final == "F":
+            self.move_to(self.y - n, 0)
+        elif final in "G`":
+            self.move_to(self.y, n - 1)
+        elif final in "Hf":
+            col = values[1] if len(values) > 1 else 1
+            self.move_to(n - 1, max(col, 1) - 1)
+        elif final == "d":
+            self.move_to(n - 1, self.x)
+        elif final == "J":
+            self.erase_display(values[0])
+        elif final == "K":
+            self.erase_line(values[0])
+        elif final == "L":
+            self.insert_lines(n)
+        elif final == "M":
+            self.delete_lines(n)
+        elif final == "@":
+            self.insert_chars(n)
+        elif final == "P":
+            self.delete_chars(n)
+        elif final == "X":
+            self.erase(self.y, self.x, self.x + n)
+        elif final == "S":
+            self.scroll_up(n)
+        elif final == "T":
+            self.scroll_down(n)
+        elif final == "r":
+            bottom = values[1] if len(values) > 1 else self.rows
+            self.set_scroll_region(values[0], bottom)
+        elif final == "s":
+            self.saved_cursor = (self.y, self.x)
+        elif final == "u":
+            self.move_to(*self.saved_cursor)
+
+    def set_private_modes(self, modes: list[str], enabled: bool):
+        for mode in modes:
+            if mode in ALT_SCREEN_MODES:
+                self.switch_screen(enabled)
+            elif mode == "25":
+                self.cursor_visible = enabled
+
+    def used_rows(self) -> int:
+        """Rows worth showing: up to the cursor or the last written row"""
+
+        if self.alternate:
+            return self.rows
+        used = self.y + 1
+        for row in range(self.rows - 1, used - 1, -1):
+            if any(cell != BLANK for cell in self.main[row]):
+                return row + 1
+        return used
+
+    def text(self) -> str:
+        """Scrollback plus the main screen, without trailing blank rows"""
+
+        lines = self.scrollback + ["".join(row).rstrip() for row in self.main]
+        while lines and not lines[-1]:
+            lines.pop()
+        return "\n".join(lines)
@@ -0,0 +1,224 @@
+import array
+import heapq
+import itertools
+import re
+import time
+import typing as t
+
+import pygame
+
+from src.glyphs import render_text
+from src.shared import Shared
+from src.utils import get_font
+
+
+class SearchLevel:
+    """Matches of one query, scanned from `source` newest first"""
+
+    __slots__ = ("query", "pattern", "exact", "source", "cursor", "matches", "top")
+
+    def __init__(self, query: str, source: t.Sequence[int]) -> None:
+        self.query = query
+        # The query's characters in order, anything in between; skipping
+        # with a negated class up to the next one never backtracks
+        self.pattern = re.compile(
+            "".join(
+                f"[^{re.escape(char)}]*{re.escape(char)}" if n else re.escape(char)
+                for n, char in enumerate(query)
+            ),
+            re.IGNORECASE,
+        )
+        self.exact = re.compile(re.escape(query), re.IGNORECASE)
+        self.source = source
+        self.cursor = 0
+        self.matches = array.array("I")
+        # Best matches so far as (quality, position), the worst first
+        self.top: list[tuple[int, int]] = []
+
+    @property
+    def done(self) -> bool:
+        return self.cursor >= len(self.source)
+
+
+class FuzzySearch:
+    """Fuzzy matches a query against every command, ranking those that
+    contain it whole above those that only have its characters in order,
+    and newer above older within each.
+
+    Each query keeps the positions it matched, so a query typed further
+    only looks through those of the one before it, and deleting goes back
+    to results already there. Scanning goes a chunk at a time until the
+    deadline passes, newest first, so the best results show up early
+    and no frame waits for the whole history.
+
+    It searches the history's own list of commands rather than a copy, as
+    copying a long one stalls the frame the search opens in. Blanked slots
+    in it are skipped.
+    """
+
+    CHUNK = 512
+    TOP = 10
+
+    def __init__(self, commands: list[str | None]) -> None:
+        self.commands = commands
+        # Searching for nothing matches everything, newest first
+        root = SearchLevel("", range(len(commands) - 1, -1, -1))
+        root.cursor = len(commands)
+        newest = (p for p in root.source if commands[p] is not None)
+        root.top = [(0, position) for position in itertools.islice(newest, self.TOP)]
+        root.top.reverse()
+        self.levels = [root]
+
+    @property
+    def query(self) -> str:
+        return self.levels[-1].query
+
+    @property
+    def done(self) -> bool:
+        return self.levels[-1].done
+
+    def set_query(self, query: str):
+        while not query.startswith(self.levels[-1].query):
+            self.levels.pop()
+        if query == self.levels[-1].query:
+            return
+        # Narrowed from the closest query that was searched through
+        parent = next(level for level in reversed(self.levels) if level.done)
+        source = parent.source if parent is self.levels[0] else parent.matches
+        self.levels.append(SearchLevel(query, source))
+
+    def advance(self, deadline: float):
+        level = self.levels[-1]
+        commands = self.commands
+        while not level.done and time.perf_counter() < deadline:
+            chunk = level.source[level.cursor : level.cursor + self.CHUNK]
+            level.cursor += self.CHUNK
+            # Blanked slots read as "", which no query matches
+            texts = [commands[position] or "" for position in chunk]
+            found = list(itertools.compress(chunk, map(level.pattern.search, texts)))
+            level.matches.extend(found)
+            for position in found:
+                rank = (1 if level.exact.search(commands[position]) else 0, position)
+                if len(level.top) < self.TOP:
+                    heapq.heappush(level.top, rank)
+                elif rank > level.top[0]:
+                    heapq.heapreplace(level.top, rank)
+
+    def results(self) -> list[str]:
+        top = sorted(self.levels[-1].top, reverse=True)
+        return [self.commands[position] for _, position in top]
+
+
+class SearchOverlay:
+    """Ctrl+R box over the bottom of the terminal, searching the history
+    as the query is typed. Up and Down or Ctrl+R again pick a result,
+    Enter puts it on the command line and Escape closes the box."""
+
+    FONT_1 = get_font("assets/fonts/bold1.ttf", 16)
+    FONT_2 = get_font("assets/fonts/regular1.ttf", 16)
+    # Share of a frame spent searching
+    BUDGET = 0.004
+    PADDING = 5
+
+    def __init__(self) -> None:
+        self.shared = Shared()
+        self.search = FuzzySearch(self.shared.data.history.commands)
+        self.selected = 0
+        self.results = self.search.results()
+        self.closed = False
+        self.chosen: str | None = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.surf: pygame.Surface | None = None
+        self.surface_key: tuple | None = None
+
+    def close(self, chosen: str | None = None):
+        self.closed = True
+        self.chosen = chosen
+
+    def move(self, step: int):
+        if self.results:
+            self.selected = (self.selected + step) % len(self.results)
+
+    def on_key(self, event):
+        if event.key == pygame.K_ESCAPE:
+            self.close()
+        elif event.key == pygame.K_RETURN:
+            if self.results:
+                self.close(self.results[self.selected])
+            else:
+                self.close()
+        elif event.key == pygame.K_BACKSPACE:
+            self.search.set_query(self.search.query[:-1])
+            self.selected = 0
+        elif event.key == pygame.K_UP or (
+            event.key == pygame.K_r and event.mod & pygame.KMOD_CTRL
+        ):
+            self.move(1)
+        elif event.key == pygame.K_DOWN:
+            self.move(-1)
+
+    def update(self):
+        for event in self.shared.events:
+            if event.type == pygame.TEXTINPUT:
+                self.search.set_query(self.search.query + event.text)
+                self.selected = 0
+            elif event.type == pygame.KEYDOWN:
+                self.on_key(event)
+
+        self.search.advance(time.perf_counter() + self.BUDGET)
+        if not self.search.done:
+            self.shared.scheduler.request()
+        self.results = self.search.results()
+        self.selected = min(self.selected, max(len(self.results) - 1, 0))
+        self.form_surface()
+
+    def form_surface(self):
+        """Renders the box, unless nothing shown in it changed"""
+
+        key = (
+            self.search.query,
+            tuple(self.results),
+            self.selected,
+            self.search.done,
+            self.shared.screen.get_size(),
+            self.shared.data.theme,
+        )
+        if key == self.surface_key:
+            return
+        self.surface_key = key
+
+        theme = self.shared.data.theme
+        line_height = self.FONT_2.get_height()
+        width = self.shared.screen.get_width() - 20
+        height = (FuzzySearch.TOP + 1) * line_height + 2 * self.PADDING
+        self.shared.damage.add(self.rect)
+        self.rect = pygame.Rect(
+            10, self.shared.screen.get_height() - height - 10, width, height
+        )
+        self.shared.damage.add(self.rect)
+
+        self.surf = pygame.Surface(self.rect.size)
+        self.surf.fill(theme["background-color"])
+        pygame.draw.rect(self.surf, theme["text-color"], self.surf.get_rect(), 1)
+        status = "" if self.search.done else "  (searching)"
+        self.surf.blit(
+            render_text(
+                self.FONT_1,
+                f"history search: {self.search.query}|{status}",
+                theme["text-color"],
+            ),
+            (self.PADDING, self.PADDING),
+        )
+        columns = width // self.FONT_2.size(" ")[0]
+        for row, command in enumerate(self.results, 1):
+            y = self.PADDING + row * line_height
+            color = theme["output-color"]
+            if row - 1 == self.selected:
+                self.surf.fill(theme["text-color"], (1, y, width - 2, line_height))
+                color = theme["background-color"]
+            self.surf.blit(
+                render_text(self.FONT_2, command[:columns], color), (self.PADDING, y)
+            )
+
+    def draw(self):
+        self.shared.screen.blit(self.surf, self.rect)
@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pygame
 
+from src.glyphs import render_text
 from src.shared import Shared
 from src.slider import HorizontalSlider
 from src.state_enums import State
@@ -31,6 +32,7 @@ class ImageBox:
 
         self.__overlay_alpha = 0
         self.overlay_surf = pygame.Surface(self.BOX_SIZE)
+        self.overlay_surf.set_alpha(self.overlay_alpha)
 
     @property
     def overlay_alpha(self):
@@ -58,9 +60,10 @@ class ImageBox:
     def on_hover(self):
         if not self.hovering:
             self.overlay_alpha -= 300 * self.shared.dt
-            return
-
-        self.overlay_alpha += 300 * self.shared.dt
+        else:
+            self.overlay_alpha += 300 * self.shared.dt
+        if 0 < self.overlay_alpha < 100:
+            self.shared.scheduler.request()
 
     def on_click(self):
         if not self.clicked:
@@ -76,15 +79,20 @@ class ImageBox:
         if self.click_timer.tick():
             self.overlay_surf.fill("black")
             self.click_highlight_done = True
+            return
+        self.shared.scheduler.request(self.click_timer.deadline)
 
     def update(self):
         self.hovering = self.rect.collidepoint(self.shared.mouse_pos - self.shared.diff)
         self.clicked = self.hovering and self.shared.clicked
 
+        alpha = self.overlay_alpha
         self.on_hover()
         self.on_click()
 
         self.overlay_surf.set_alpha(self.overlay_alpha)
+        if self.overlay_alpha != alpha or not self.click_highlight_done:
+            self.shared.damage.add(self.rect.move(self.shared.diff))
         if not self.click_highlight_done:
             self.highlight_click()
 
@@ -105,7 +113,7 @@ class DefaultBox(ImageBox):
         )
         render_at(
             self.image,
-            self.FONT.render("default", True, self.shared.data.theme["text-color"]),
+            render_text(self.FONT, "default", self.shared.data.theme["text-color"]),
             "center",
         )
 
@@ -181,6 +189,9 @@ class OpacitySelector:
 
     def update(self):
         self.slider.update(self.shared.events)
+        if self.slider.clicked:
+            radius = self.slider.radius
+            self.shared.damage.add(self.slider.rail.inflate(2 * radius, 2 * radius))
 
         if self.shared.resizing:
             self.on_win_resize()
@@ -211,11 +222,12 @@ class ThemeBox:
 
         self.__overlay_alpha = 0
         self.overlay_surf = pygame.Surface(self.BOX_SIZE)
+        self.overlay_surf.set_alpha(self.overlay_alpha)
 
     def get_image(self):
         self.image = pygame.Surface(self.BOX_SIZE)
         self.image.fill(self.theme["background-color"])
-        name_surf = self.FONT.render(self.name, True, self.theme["text-color"])
+        name_surf = render_text(self.FONT, self.name, self.theme["text-color"])
         render_at(self.image, name_surf, "center")
 
     @property
@@ -244,9 +256,10 @@ class ThemeBox:
     def on_hover(self):
         if not self.hovering:
             self.overlay_alpha -= 300 * self.shared.dt
-            return
-
-        self.overlay_alpha += 300 * self.shared.dt
+        else:
+            self.overlay_alpha += 300 * self.shared.dt
+        if 0 < self.overlay_alpha < 100:
+            self.shared.scheduler.request()
 
     def on_click(self):
         if not self.clicked:
@@ -256,21 +269,29 @@ class ThemeBox:
         self.click_highlight_done = False
         self.shared.data.theme = self.theme
         self.shared.data.config["theme"] = self.name
+        # Everything cached was rendered in the old theme's colors
+        self.shared.surfaces.clear()
+        self.shared.damage.everything()
 
     def highlight_click(self):
         self.overlay_surf.fill("yellow")
         if self.click_timer.tick():
             self.overlay_surf.fill("black")
             self.click_highlight_done = True
+            return
+        self.shared.scheduler.request(self.click_timer.deadline)
 
     def update(self):
         self.hovering = self.rect.collidepoint(self.shared.mouse_pos - self.shared.diff)
         self.clicked = self.hovering and self.shared.clicked
 
+        alpha = self.overlay_alpha
         self.on_hover()
         self.on_click()
 
         self.overlay_surf.set_alpha(self.overlay_alpha)
+        if self.overlay_alpha != alpha or not self.click_highlight_done:
+            self.shared.damage.add(self.rect.move(self.shared.diff))
         if not self.click_highlight_done:
             self.highlight_click()
 
@@ -292,9 +313,9 @@ class ThemeSelector:
         self.shared.diff = pygame.Vector2(self.surf_rect.topleft)
 
     def text_init(self):
-        self.text_surf = self.FONT.render(
+        self.text_surf = render_text(
+            self.FONT,
             f"Theme Selected: {self.shared.data.config['theme']}",
-            True,
             self.shared.data.theme["background-color"],
             self.shared.data.theme["text-color"],
         )
@@ -317,6 +338,7 @@ class ThemeSelector:
         for box in self.boxes:
             if box.clicked:
                 self.text_init()
+                self.shared.damage.everything()
             box.update()
         self.shared.diff = pygame.Vector2(self.surf_rect.topleft)
 
@@ -345,8 +367,8 @@ class Button:
         self.image.fill(self.shared.data.theme["text-color"])
         render_at(
             self.image,
-            self.FONT.render(
-                self.name, True, self.shared.data.theme["background-color"]
+            render_text(
+                self.FONT, self.name, self.shared.data.theme["background-color"]
             ),
             "center",
         )
@@ -356,6 +378,7 @@ class Button:
 
         self.__overlay_alpha = 0
         self.overlay_surf = pygame.Surface(self.SIZE)
+        self.overlay_surf.set_alpha(self.overlay_alpha)
 
     def get_positional_rect(self):
         self.rect = pygame.Rect((0, 0), self.SIZE)
@@ -381,9 +404,10 @@ class Button:
     def on_hover(self):
         if not self.hovering:
             self.overlay_alpha -= 300 * self.shared.dt
-            return
-
-        self.overlay_alpha += 300 * self.shared.dt
+        else:
+            self.overlay_alpha += 300 * self.shared.dt
+        if 0 < self.overlay_alpha < 100:
+            self.shared.scheduler.request()
 
     def on_click(self):
         if not self.clicked:
@@ -397,15 +421,20 @@ class Button:
         if self.click_timer.tick():
             self.overlay_surf.fill("black")
             self.click_highlight_done = True
+            return
+        self.shared.scheduler.request(self.click_timer.deadline)
 
     def update(self):
         self.hovering = self.rect.collidepoint(self.shared.mouse_pos)
         self.clicked = self.hovering and self.shared.clicked
 
+        alpha = self.overlay_alpha
         self.on_hover()
         self.on_click()
 
         self.overlay_surf.set_alpha(self.overlay_alpha)
+        if self.overlay_alpha != alpha or not self.click_highlight_done:
+            self.shared.damage.add(self.rect)
         if not self.click_highlight_done:
             self.highlight_click()
 
@@ -438,6 +467,7 @@ class SettingState:
 
             if button.clicked:
                 self.current_setting = self.settings.get(button.name)
+                self.shared.damage.everything()
             button.update()
 
     def on_win_resize(self):
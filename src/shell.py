@@ -0,0 +1,550 @@
+import asyncio
+import collections
+import itertools
+import os
+import re
+import secrets
+import shlex
+import signal
+import struct
+import subprocess
+import typing as t
+from pathlib import Path
+from urllib.parse import unquote
+
+try:
+    import fcntl
+    import pty
+    import termios
+except ImportError:
+    pty = None
+
+CHUNK_SIZE = 4096
+SIGKILL = getattr(signal, "SIGKILL", signal.SIGTERM)
+PWSH_NAMES = ("pwsh", "powershell")
+OSC7_START = b"\x1b]7;"
+OSC7_PATTERN = re.compile(
+    rb"\x1b\]7;file://[^/\x07\x1b]*(/[^\x07\x1b]*)(?:\x07|\x1b\\)"
+)
+OSC7_END = re.compile(rb"\x07|\x1b\\")
+# Longer than any directory reported, so a start never ended isn't held forever
+OSC7_MAX = 16384
+WINDOWS_DRIVE_PATTERN = re.compile(r"/[A-Za-z]:")
+
+# Waits while whoever consumes the output is too far behind
+Drain = t.Callable[[], t.Awaitable[None]]
+
+
+def is_pwsh(executable: str) -> bool:
+    return Path(executable).stem.lower() in PWSH_NAMES
+
+
+def signal_group(process: asyncio.subprocess.Process | None, sig: int):
+    """Signals a process started in its own session and everything it spawned"""
+
+    if process is None or process.returncode is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, sig)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+def session_groups(session: int) -> set[int]:
+    """Process groups of every process in a session"""
+
+    groups = set()
+    if os.path.isdir("/proc"):
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    # The name in parentheses can hold spaces
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            if int(fields[3]) == session:
+                groups.add(int(fields[2]))
+        return groups
+
+    result = subprocess.run(
+        ["pgrep", "-s", str(session)], capture_output=True, text=True
+    )
+    for pid in result.stdout.split():
+        try:
+            groups.add(os.getpgid(int(pid)))
+        except ProcessLookupError:
+            continue
+    return groups
+
+
+def command_args(executable: str, command: str) -> tuple[str, ...]:
+    """Arguments to run a single command in a fresh shell"""
+
+    if is_pwsh(executable):
+        return (executable, "-Command", command)
+    return (executable, "-c", command)
+
+
+def warm_args(executable: str) -> tuple[str, ...]:
+    """Arguments that start a shell waiting for its script on stdin"""
+
+    if is_pwsh(executable):
+        return (executable, "-NoLogo", "-Command", "-")
+    return (executable,)
+
+
+def quote(executable: str, text: str) -> str:
+    if is_pwsh(executable):
+        return "'" + text.replace("'", "''") + "'"
+    return shlex.quote(text)
+
+
+def run_line(executable: str, command: str, detach_stdin: bool = True) -> str:
+    """Runs the command, keeping its exit code in $__axterm_status"""
+
+    if is_pwsh(executable):
+        return (
+            "$global:LASTEXITCODE = 0\n"
+            f"Invoke-Expression {quote(executable, command)}\n"
+            "$__axterm_status = if ($?) { $global:LASTEXITCODE } "
+            "elseif ($global:LASTEXITCODE) { $global:LASTEXITCODE } else { 1 }\n"
+        )
+    redirect = " </dev/null" if detach_stdin else ""
+    return f"eval {quote(executable, command)}{redirect}\n__axterm_status=$?\n"
+
+
+def cwd_line(executable: str) -> str:
+    """Reports the shell's directory with an OSC 7 sequence on stdout"""
+
+    if is_pwsh(executable):
+        uri = "$([Uri]::new($PWD.ProviderPath).AbsoluteUri)"
+        return f'[Console]::Out.Write("`e]7;{uri}`a")\n'
+    # Percent-encoded, as the reader decodes it like the URL pwsh sends
+    return (
+        "__axterm_rest=$PWD __axterm_cwd=\n"
+        "while :; do case $__axterm_rest in *%*) ;; *) break ;; esac\n"
+        "__axterm_cwd=$__axterm_cwd${__axterm_rest%%\\%*}%25 "
+        "__axterm_rest=${__axterm_rest#*\\%}; done\n"
+        "printf '\\033]7;file://%s%s\\007' \"$HOSTNAME\" "
+        '"$__axterm_cwd$__axterm_rest"\n'
+    )
+
+
+def cd_line(executable: str, cwd: Path) -> str:
+    if is_pwsh(executable):
+        return f"Set-Location -LiteralPath {quote(executable, str(cwd))}\n"
+    return f"cd -- {quote(executable, str(cwd))}\n"
+
+
+def exit_line(executable: str) -> str:
+    return "exit $__axterm_status\n"
+
+
+def isolated_script(executable: str, command: str, detach_stdin: bool = True) -> str:
+    """Script for a fresh shell that runs one command, reports
+    its directory, then exits with the command's code"""
+
+    return (
+        run_line(executable, command, detach_stdin)
+        + cwd_line(executable)
+        + exit_line(executable)
+    )
+
+
+def frame_command(
+    executable: str, command: str, marker: str, cwd: Path | None = None
+) -> str:
+    """Wraps a command so that, once it is done, the shell reports its
+    directory and prints a sentinel line with the exit code to both streams.
+    On stdout the line also lists the shell's background jobs."""
+
+    script = cd_line(executable, cwd) if cwd is not None else ""
+    script += run_line(executable, command) + cwd_line(executable)
+    if is_pwsh(executable):
+        status = f"`n{marker} $__axterm_status`n"
+        return (
+            script
+            + f'[Console]::Out.Write("{status}")\n'
+            + f'[Console]::Error.Write("{status}")\n'
+        )
+
+    status = f'{marker} "$__axterm_status"'
+    return (
+        script
+        + f"printf '\\n%s %d' {status}\nprintf ' %s' $(jobs -p)\nprintf '\\n'\n"
+        + f"printf '\\n%s %d\\n' {status} >&2\n"
+    )
+
+
+async def read_stream(
+    stream: asyncio.StreamReader,
+    on_output: t.Callable[[bytes], None],
+    drain: Drain | None = None,
+):
+    while chunk := await stream.read(CHUNK_SIZE):
+        on_output(chunk)
+        if drain is not None:
+            await drain()
+
+
+class CwdTracker:
+    """Strips OSC 7 ("current directory") sequences out of a stream
+    before passing it on, remembering the last directory reported"""
+
+    def __init__(self, on_output: t.Callable[[bytes], None]) -> None:
+        self.on_output = on_output
+        self.cwd: Path | None = None
+        self.pending = b""
+
+    def feed(self, data: bytes):
+        data = self.pending + data
+        self.pending = b""
+        for match in OSC7_PATTERN.finditer(data):
+            path = unquote(match[1].decode(errors="replace"))
+            if WINDOWS_DRIVE_PATTERN.match(path):
+                path = path[1:]
+            self.cwd = Path(path)
+        data = OSC7_PATTERN.sub(b"", data)
+
+        # Hold back a sequence split across chunks, even within its start
+        start = data.rfind(OSC7_START)
+        if (
+            start == -1
+            or OSC7_END.search(data, start) is not None
+            or len(data) - start > OSC7_MAX
+        ):
+            start = len(data)
+            for size in range(len(OSC7_START) - 1, 0, -1):
+                if data.endswith(OSC7_START[:size]):
+                    start -= size
+                    break
+        self.pending = data[start:]
+        data = data[:start]
+        if data:
+            self.on_output(data)
+
+    def close(self):
+        if self.pending:
+            self.on_output(self.pending)
+            self.pending = b""
+
+
+class ShellSession:
+    """A long-lived shell process that commands are written to one at a time.
+
+    Output is framed by a sentinel line printed after each command, which
+    also carries the exit code. The shell reports its directory with OSC 7.
+
+    The shell runs with job control, so each command it starts gets a
+    process group of its own. Interrupting signals those groups rather
+    than the shell, which keeps its env, and the shell then drops the
+    rest of the command line, loops included.
+    """
+
+    def __init__(self, executable: str, cwd: Path) -> None:
+        self.executable = executable
+        self.cwd = cwd
+        self.process: asyncio.subprocess.Process | None = None
+        self.lock = asyncio.Lock()
+        self.token = secrets.token_hex(4)
+        self.counter = itertools.count()
+        # Groups of the jobs left running in the background, which an
+        # interrupt leaves alone as a terminal would
+        self.background: set[int] = set()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *warm_args(self.executable),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd,
+            start_new_session=True,
+        )
+        self.background = set()
+        if not is_pwsh(self.executable):
+            # A shell whose job died of SIGINT acts as if it got it too,
+            # so trapping it keeps the shell alive
+            self.process.stdin.write(
+                b"shopt -s expand_aliases 2>/dev/null\nset -m\ntrap : INT\n"
+            )
+
+    def signal_jobs(self, sig: int):
+        """Signals the command running in the session and whatever it
+        started, leaving the shell itself and its background jobs alone"""
+
+        if not self.alive:
+            return
+        if is_pwsh(self.executable) or not hasattr(os, "killpg"):
+            signal_group(self.process, sig)
+            return
+        groups = session_groups(self.process.pid)
+        for group in groups - self.background - {self.process.pid}:
+            try:
+                os.killpg(group, sig)
+            except ProcessLookupError:
+                pass
+
+    async def read_until(
+        self,
+        stream: asyncio.StreamReader,
+        marker: str,
+        on_output: t.Callable[[bytes], None],
+        drain: Drain | None = None,
+    ) -> str | None:
+        """Feeds the stream to `on_output` until the sentinel line,
+        returning the rest of that line, or None if the shell died"""
+
+        tag = f"\n{marker} ".encode()
+        pending = b""
+        while chunk := await stream.read(CHUNK_SIZE):
+            if drain is not None:
+                await drain()
+            pending += chunk
+            index = pending.find(tag)
+            if index == -1:
+                # Hold back just enough bytes to catch a split sentinel
+                keep = len(tag) - 1
+                if len(pending) > keep:
+                    on_output(pending[:-keep])
+                    pending = pending[-keep:]
+                continue
+
+            on_output(pending[:index])
+            pending = pending[index:]
+            end = pending.find(b"\n", len(tag))
+            if end != -1:
+                return pending[len(tag) : end].decode(errors="replace")
+
+        if pending:
+            on_output(pending)
+        return None
+
+    async def run(
+        self,
+        command: str,
+        cwd: Path,
+        on_output: t.Callable[[bytes], None],
+        drain: Drain | None = None,
+    ) -> tuple[int, Path]:
+        """Runs a command in the session from `cwd`, returning its
+        exit code and the working directory the shell was left in"""
+
+        async with self.lock:
+            if not self.alive:
+                await self.start()
+
+            marker = f"__AXTERM_{self.token}_{next(self.counter)}__"
+            script = frame_command(
+                self.executable, command, marker, cwd if cwd != self.cwd else None
+            )
+            try:
+                self.process.stdin.write(script.encode())
+                await self.process.stdin.drain()
+            except ConnectionError:
+                pass
+
+            tracker = CwdTracker(on_output)
+            status, _ = await asyncio.gather(
+                self.read_until(self.process.stdout, marker, tracker.feed, drain),
+                self.read_until(self.process.stderr, marker, on_output, drain),
+            )
+            tracker.close()
+            self.cwd = tracker.cwd or cwd
+            if status is None:
+                return await self.process.wait(), self.cwd
+            code, *background = status.split()
+            self.background = set(map(int, background))
+            return int(code), self.cwd
+
+
+class ShellPool:
+    """Shells started ahead of time in the current directory, each one
+    used for exactly one command so that commands stay isolated"""
+
+    def __init__(self, executable: str, size: int, cwd: Path) -> None:
+        self.executable = executable
+        self.size = size
+        self.cwd = cwd
+        self.idle: collections.deque[asyncio.subprocess.Process] = collections.deque()
+        self.fill_task: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    async def spawn(self) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(
+            *warm_args(self.executable),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd,
+            start_new_session=True,
+        )
+
+    async def fill(self):
+        while len(self.idle) < self.size:
+            cwd = self.cwd
+            process = await self.spawn()
+            if cwd != self.cwd:
+                process.kill()
+                continue
+            self.idle.append(process)
+
+    def refill(self):
+        """Tops the pool back up in the background"""
+
+        if len(self.idle) >= self.size:
+            return
+        if self.fill_task is None or self.fill_task.done():
+            self.fill_task = asyncio.create_task(self.fill())
+
+    def retarget(self, cwd: Path):
+        """Replaces the idle shells once the directory changes"""
+
+        self.cwd = cwd
+        while self.idle:
+            self.idle.popleft().kill()
+
+    async def acquire(self, cwd: Path) -> asyncio.subprocess.Process:
+        if cwd != self.cwd:
+            self.retarget(cwd)
+
+        while self.idle:
+            process = self.idle.popleft()
+            if process.returncode is None:
+                self.hits += 1
+                self.refill()
+                return process
+
+        self.misses += 1
+        process = await self.spawn()
+        self.refill()
+        return process
+
+    async def run(
+        self,
+        process: asyncio.subprocess.Process,
+        command: str,
+        cwd: Path,
+        on_output: t.Callable[[bytes], None],
+        drain: Drain | None = None,
+    ) -> tuple[int, Path]:
+        """Hands the command to an acquired warm shell, returning
+        its exit code and the directory it finished in"""
+
+        try:
+            process.stdin.write(isolated_script(self.executable, command).encode())
+            await process.stdin.drain()
+            process.stdin.close()
+        except ConnectionError:
+            pass
+
+        tracker = CwdTracker(on_output)
+        await asyncio.gather(
+            read_stream(process.stdout, tracker.feed, drain),
+            read_stream(process.stderr, on_output, drain),
+        )
+        tracker.close()
+        return await process.wait(), tracker.cwd or cwd
+
+
+def set_controlling_tty():
+    fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+
+
+class PtyProcess:
+    """A command running on a pseudo-terminal, for programs that
+    need a real terminal (REPLs, pagers, full screen programs)"""
+
+    available = pty is not None
+
+    def __init__(self, executable: str, cols: int, rows: int) -> None:
+        self.executable = executable
+        self.size = cols, rows
+        self.master: int | None = None
+        self.process: asyncio.subprocess.Process | None = None
+
+    def write(self, data: bytes):
+        if self.master is None:
+            return
+        try:
+            os.write(self.master, data)
+        except OSError:
+            pass
+
+    def resize(self, cols: int, rows: int):
+        """Sets the terminal size, which makes the kernel SIGWINCH the child"""
+
+        self.size = cols, rows
+        if self.master is not None:
+            winsize = struct.pack("HHHH", rows, cols, 0, 0)
+            fcntl.ioctl(self.master, termios.TIOCSWINSZ, winsize)
+
+    async def run(
+        self, command: str, cwd: Path, on_output: t.Callable[[bytes], None]
+    ) -> tuple[int, Path]:
+        """Runs the command, returning its exit code
+        and the directory it finished in"""
+
+        script = isolated_script(self.executable, command, detach_stdin=False)
+        tracker = CwdTracker(on_output)
+        self.master, slave = pty.openpty()
+        self.resize(*self.size)
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *command_args(self.executable, script),
+                stdin=slave,
+                stdout=slave,
+                stderr=slave,
+                cwd=cwd,
+                env=os.environ | {"TERM": "xterm-256color"},
+                start_new_session=True,
+                preexec_fn=set_controlling_tty,
+            )
+        except OSError:
+            os.close(self.master)
+            self.master = None
+            raise
+        finally:
+            os.close(slave)
+
+        loop = asyncio.get_running_loop()
+        closed = loop.create_future()
+
+        def on_readable():
+            try:
+                data = os.read(self.master, CHUNK_SIZE)
+            except BlockingIOError:
+                return
+            except OSError:
+                # Linux raises EIO once every end of the slave is closed
+                data = b""
+            if data:
+                tracker.feed(data)
+            else:
+                loop.remove_reader(self.master)
+                closed.set_result(None)
+
+        os.set_blocking(self.master, False)
+        loop.add_reader(self.master, on_readable)
+        try:
+            await closed
+            tracker.close()
+            return await self.process.wait(), tracker.cwd or cwd
+        finally:
+            os.close(self.master)
+            self.master = None
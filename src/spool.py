@@ -0,0 +1,114 @@
+import array
+import mmap
+import tempfile
+import typing as t
+
+from src.ansi import CONTROL_PATTERN, PLAIN, Span, Style, parse_line, plain_text
+
+
+class Spool:
+    """Lines of an output too large to keep in memory, appended to an
+    anonymous temporary file and read back through mmap. `starts` holds
+    the offset each line begins at, so reading a line touches only its
+    own bytes. Lines are kept raw and parsed again when asked for,
+    from the style recorded as in effect where each one starts.
+
+    Appended lines only count once committed, so they can be written
+    ahead while the buffer still holds them.
+    """
+
+    def __init__(self) -> None:
+        self.file = tempfile.TemporaryFile(prefix="axterm-")
+        self.size = 0
+        self.starts = array.array("Q")
+        # Outputs use a handful of styles, so lines refer to them by id
+        self.styles: list[Style] = [PLAIN]
+        self.style_ids: dict[Style, int] = {PLAIN: 0}
+        self.start_styles = array.array("H")
+        self.map: mmap.mmap | None = None
+        self.committed = 0
+
+    def __len__(self) -> int:
+        return self.committed
+
+    def commit(self) -> None:
+        self.committed = len(self.starts)
+
+    def append(self, lines: t.Sequence[str], start_styles: t.Sequence[Style]) -> None:
+        chunks = []
+        for line, style in zip(lines, start_styles):
+            data = line.encode()
+            self.starts.append(self.size)
+            self.start_styles.append(self.style_id(style))
+            self.size += len(data) + 1
+            chunks.append(data)
+        chunks.append(b"")
+        self.file.write(b"\n".join(chunks))
+        self.file.flush()
+
+    def style_id(self, style: Style) -> int:
+        if style not in self.style_ids:
+            self.style_ids[style] = len(self.styles)
+            self.styles.append(style)
+        return self.style_ids[style]
+
+    def read(self, start: int, end: int) -> bytes:
+        if self.map is None or len(self.map) < end:
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self.map[start:end]
+
+    def line(self, index: int) -> str:
+        end = self.starts[index + 1] if index + 1 < len(self.starts) else self.size
+        return self.read(self.starts[index], end - 1).decode()
+
+    def spans(self, index: int) -> tuple[Span, ...]:
+        style = self.styles[self.start_styles[index]]
+        return parse_line(self.line(index), style)[0]
+
+    def text(self) -> str:
+        if not self.committed:
+            return ""
+        end = (
+            self.starts[self.committed]
+            if self.committed < len(self.starts)
+            else self.size
+        )
+        text = self.read(0, end - 1).decode()
+        if "\x1b" in text or "\r" in text or "\t" in text:
+            return plain_text(self.spans(i) for i in range(len(self)))
+        return CONTROL_PATTERN.sub("", text)
+
+
+class SpooledLines:
+    """Parsed lines of an output whose head has spilled to a spool,
+    indexed like the list of spans it stands in for"""
+
+    def __init__(self, spool: Spool, tail: list[tuple[Span, ...]]) -> None:
+        self.spool = spool
+        self.tail = tail
+
+    def __len__(self) -> int:
+        return len(self.spool) + len(self.tail)
+
+    def __getitem__(self, index: int) -> tuple[Span, ...]:
+        if index < 0:
+            index += len(self)
+        if index < len(self.spool):
+            return self.spool.spans(index)
+        return self.tail[index - len(self.spool)]
+
+    @property
+    def text(self) -> str:
+        if not self.tail:
+            return self.spool.text()
+        return "\n".join((self.spool.text(), plain_text(self.tail)))
+
+
+def lines_text(lines: t.Sequence[t.Sequence[Span]]) -> str:
+    """Plain text of parsed lines, spooled or not"""
+
+    if isinstance(lines, SpooledLines):
+        return lines.text
+    return plain_text(lines)
@@ -3,11 +3,12 @@ import typing as t
 import pygame
 
 from src.controlstate import ControlState
+from src.glyphs import render_text
 from src.settingstate import SettingState
 from src.shared import Shared
 from src.state_enums import State
 from src.terminalstate import TerminalState
-from src.utils import render_at, scale_image_perfect
+from src.utils import get_font, render_at, scale_image_perfect
 
 
 class StateLike(t.Protocol):
@@ -21,6 +22,8 @@ class StateLike(t.Protocol):
 
 
 class StateManager:
+    DEBUG_FONT = get_font("assets/fonts/regular1.ttf", 12)
+
     def __init__(self) -> None:
         self.shared = Shared()
         self.state_dict: dict[State, StateLike] = {
@@ -28,10 +31,13 @@ class StateManager:
             State.SETTINGS: SettingState(),
             State.CONTROLS: ControlState(),
         }
+        self.__state_enum: State | None = None
         self.state_enum = State.CONTROLS
-        self.state_obj: StateLike = self.state_dict.get(self.state_enum)
         self.init_image_file()
         self.last_image_file = self.shared.data.image_file
+        self.debug_overlay = self.shared.data.config["debug-overlay"]
+        self.debug_surf: pygame.Surface | None = None
+        self.debug_rect = pygame.Rect(0, 0, 0, 0)
 
     def init_image_file(self):
         if self.shared.data.image_file is not None:
@@ -51,8 +57,11 @@ class StateManager:
 
     @state_enum.setter
     def state_enum(self, next_state: State) -> None:
+        if next_state is self.__state_enum:
+            return
         self.__state_enum = next_state
         self.state_obj: StateLike = self.state_dict.get(self.__state_enum)
+        self.shared.damage.everything()
 
     def on_win_resize(self):
         self.shared.resizing = False
@@ -72,6 +81,29 @@ class StateManager:
         if self.shared.keys[pygame.K_LCTRL] and self.shared.keys[pygame.K_q]:
             self.state_obj.next_state = State.CONTROLS
 
+    def on_f3(self):
+        for event in self.shared.events:
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.debug_overlay = not self.debug_overlay
+                self.shared.damage.everything()
+
+    def update_debug_overlay(self):
+        """Surface cache counters, in the top right corner"""
+
+        self.debug_surf = render_text(
+            self.DEBUG_FONT,
+            self.shared.surfaces.stats(),
+            self.shared.data.theme["background-color"],
+            self.shared.data.theme["text-color"],
+        )
+        rect = self.debug_surf.get_rect(topright=self.shared.screen.get_rect().topright)
+        rect.move_ip(-10, 10)
+        self.shared.damage.add(rect.union(self.debug_rect))
+        self.debug_rect = rect
+
+    def draw_debug_overlay(self):
+        self.shared.screen.blit(self.debug_surf, self.debug_rect)
+
     def fit_bg_image(self):
         if self.shared.resizing and self.image is not None:
             self.image = scale_image_perfect(
@@ -87,19 +119,30 @@ class StateManager:
         self.on_ctrl_s()
         self.on_ctrl_q()
         self.on_ctrl_t()
+        self.on_f3()
         self.on_win_resize()
         self.fit_bg_image()
         self.state_obj.update()
 
         if self.shared.data.image_file != self.last_image_file:
             self.init_image_file()
+            self.shared.damage.everything()
 
-        if self.state_obj.next_state is not None:
-            self.state_enum = self.state_obj.next_state
+        # Taken once, as with frames only on events nothing else would
+        # overwrite a stale one
+        next_state = self.state_obj.next_state
+        if next_state is not None:
+            self.state_obj.next_state = None
+            if next_state != self.state_enum:
+                self.state_enum = next_state
 
         self.last_image_file = self.shared.data.image_file
+        if self.debug_overlay:
+            self.update_debug_overlay()
 
     def draw(self):
         if self.image is not None:
             render_at(self.shared.screen, self.image, "center")
         self.state_obj.draw()
+        if self.debug_overlay:
+            self.draw_debug_overlay()
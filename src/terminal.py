@@ -1,29 +1,66 @@
+import bisect
+import gc
 import itertools
 import os
-import subprocess
+import time
 from pathlib import Path
 
 import pygame
 
+from src.builtins import Builtins
 from src.button import CopyButton
-from src.prompt import Prompt
+from src.jobs import JobQueue
+from src.paths import DirectoryCache
+from src.prompt import Prompt, PromptRecord
+from src.search import SearchOverlay
 from src.shared import Shared
+from src.shell import ShellPool, ShellSession
 
 
 class Terminal:
     SCROLL_SCALE = 30
+    # Share of a frame spent reflowing prompts after a resize
+    REFLOW_BUDGET = 0.004
+    # Share of a frame spent turning queued output into lines, between
+    # all the prompts running
+    OUTPUT_BUDGET = 0.004
 
     def __init__(self) -> None:
         self.shared = Shared()
         self.shared.cwd = Path(os.path.expanduser("~"))
+        self.shared.previous_cwd = None
+        self.shared.paths = DirectoryCache()
+        self.shared.paths.warm(self.shared.cwd)
+        self.builtins = Builtins()
+        self.shared.builtins = self.builtins
+        self.session = ShellSession(self.shared.data.config["shell"], self.shared.cwd)
+        self.shared.session = self.session
+        self.pool = ShellPool(
+            self.shared.data.config["shell"],
+            self.shared.data.config["pool-size"],
+            self.shared.cwd,
+        )
+        self.shared.pool = self.pool
+        self.jobs = JobQueue(self.shared.data.config["max-jobs"])
+        self.shared.jobs = self.jobs
 
         self.prompts: list[Prompt] = [Prompt()]
         self.__current_prompt_index = 0
         self.current_prompt = self.prompts[self.__current_prompt_index]
         self.copy_buttons = []
+        self.pending: list[Prompt] = []
+        # Where each finished prompt starts, relative to the first one,
+        # followed by where the prompts still running or typed in start
+        self.offsets = [0]
+        self.visible = range(0)
+        # Settled prompts before this one are laid out at the current width
+        self.reflowed = 0
+        # What decides where every prompt is drawn, as of the last frame
+        self.placement: tuple | None = None
 
         self.perm_offset = 0
         self.start = None
+        self.search: SearchOverlay | None = None
 
     @property
     def current_prompt_index(self) -> int:
@@ -34,21 +71,52 @@ class Terminal:
         self.__current_prompt_index = val
         self.current_prompt = self.prompts[val]
 
-    def change_directory(self):
-        """Changes the directory in which the next prompt spawns"""
+    @property
+    def active_prompts(self) -> list[Prompt]:
+        if self.current_prompt in self.pending:
+            return self.pending
+        return self.pending + [self.current_prompt]
+
+    def on_win_resize(self):
+        for prompt in self.active_prompts:
+            prompt.on_win_resize()
+        cols = self.current_prompt.columns()
+        for prompt in self.prompts:
+            prompt.layout.reset(cols)
+        self.reflowed = 0
+        self.reindex()
 
-        command = f"{self.current_prompt.command};pwd"
-        output = subprocess.check_output(
-            [self.current_prompt.executable, "-Command", command],
-            shell=True,
-            universal_newlines=True,
-            cwd=self.shared.cwd,
-        )
-        stripped = output.strip()
-        lines = stripped.splitlines()
-        line = lines[-1].replace("\\", "/")
-        path = bytes(line, "ascii").decode("unicode-escape")
-        self.shared.cwd = Path(path)
+    def reflow(self):
+        """Counts the wrapped rows of settled prompts laid out for an
+        old width, those in view first and the rest a budget's worth
+        per frame, so resizing never waits on all of them"""
+
+        settled = len(self.offsets) - 1
+        if self.reflowed >= settled:
+            return
+        deadline = time.perf_counter() + self.REFLOW_BUDGET
+        for index in itertools.chain(self.visible, range(self.reflowed, settled)):
+            if index < settled:
+                prompt = self.prompts[index]
+                if not prompt.layout.count(prompt, deadline):
+                    break
+        while self.reflowed < settled:
+            prompt = self.prompts[self.reflowed]
+            if prompt.layout.counted < prompt.line_count:
+                break
+            self.reflowed += 1
+        if self.reflowed < settled:
+            self.shared.scheduler.request()
+        self.reindex()
+        self.shared.damage.everything()
+
+    def reindex(self):
+        """Rebuilds the offsets of the finished prompts from their heights"""
+
+        settled = len(self.offsets) - 1
+        self.offsets = [0]
+        for prompt in self.prompts[:settled]:
+            self.offsets.append(self.offsets[-1] + prompt.height + 10)
 
     def handle_perm_offset(self):
         for event in self.shared.events:
@@ -59,51 +127,182 @@ class Terminal:
         if self.shared.keys[pygame.K_LCTRL] and self.shared.keys[pygame.K_g]:
             self.perm_offset = 0
 
-    def clear_prompts(self):
+    def clear_prompts(self, index: int):
+        """Clears every prompt up to the clearing one,
+        keeping the jobs submitted after it"""
+
         self.perm_offset = 0
-        self.copy_buttons.clear()
-        self.prompts.clear()
-        self.prompts.append(Prompt())
-        self.current_prompt_index = 0
+        del self.copy_buttons[: index + 1]
+        del self.prompts[: index + 1]
+        self.reflowed = max(self.reflowed - index - 1, 0)
+        self.current_prompt_index = self.prompts.index(self.current_prompt)
+        start = self.offsets[index + 1]
+        self.offsets = [offset - start for offset in self.offsets[index + 1 :]]
 
-    def special_commands(self):
-        if not self.current_prompt.released:
-            return
-        if self.current_prompt.command.strip() in ("cls", "clear"):
-            self.clear_prompts()
-        elif self.current_prompt.command.strip() == "exit":
+    def special_commands(self, prompt: Prompt, index: int):
+        if prompt.builtin in ("cls", "clear"):
+            self.clear_prompts(index)
+        elif prompt.builtin == "exit":
             self.shared.data.on_exit()
             exit()
-        elif "cd" in self.current_prompt.command:
-            self.change_directory()
+
+    def on_finish(self):
+        """Freezes finished prompts into records and applies clear
+        and exit, once every job before them is done"""
+
+        while self.pending and self.pending[0].finished:
+            prompt = self.pending.pop(0)
+            index = len(self.offsets) - 1
+            self.offsets.append(self.offsets[-1] + prompt.height + 10)
+            self.prompts[index] = PromptRecord(prompt)
+            self.copy_buttons[index].prompt = self.prompts[index]
+            self.shared.data.log_command(
+                prompt.command.strip(),
+                prompt.started,
+                prompt.cwd,
+                prompt.exit_code,
+                prompt.duration,
+            )
+            self.special_commands(prompt, index)
+
+    def record(self, prompt: Prompt):
+        self.shared.data.add_history(prompt.command.strip())
+        self.copy_buttons.append(CopyButton(prompt))
+        self.pending.append(prompt)
 
     def on_release(self):
-        if not self.current_prompt.released:
+        prompt = self.current_prompt
+        if not prompt.released:
             return
-        if self.current_prompt.command.strip() in self.shared.data.command_history:
-            self.shared.data.command_history.remove(self.current_prompt.command.strip())
-        self.shared.data.command_history.append(self.current_prompt.command.strip())
-        self.shared.data.current_index = len(self.shared.data.command_history)
-        self.copy_buttons.append(CopyButton(self.current_prompt.output))
+        if prompt.use_pty and not prompt.finished:
+            # Programs on a pty keep the keyboard until they exit
+            return
+        self.record(prompt)
+
+        for line in prompt.batch[:-1]:
+            batch_prompt = Prompt()
+            batch_prompt.text = list(line)
+            batch_prompt.command = line
+            batch_prompt.submit()
+            self.prompts.append(batch_prompt)
+            self.record(batch_prompt)
+
         self.prompts.append(Prompt())
-        self.current_prompt_index += 1
+        self.current_prompt_index = len(self.prompts) - 1
+        # Updated from the next frame on, so it asks for its blinks then
+        self.shared.scheduler.request()
+        if prompt.batch:
+            self.current_prompt.text = list(prompt.batch[-1])
 
     def update_copies(self):
-        for btn in self.copy_buttons:
+        for btn in self.copy_buttons[self.visible.start : self.visible.stop]:
             btn.update()
 
+    def on_search(self):
+        """Opens the history search on Ctrl+R, which then takes the
+        keyboard until it's closed"""
+
+        if self.search is None and not self.current_prompt.released:
+            for event in self.shared.events:
+                if (
+                    event.type == pygame.KEYDOWN
+                    and event.key == pygame.K_r
+                    and event.mod & pygame.KMOD_CTRL
+                ):
+                    self.search = SearchOverlay()
+                    self.shared.events.remove(event)
+                    break
+        if self.search is None:
+            return
+
+        self.search.update()
+        self.shared.events = [
+            event
+            for event in self.shared.events
+            if event.type not in (pygame.KEYDOWN, pygame.KEYUP, pygame.TEXTINPUT)
+        ]
+        if self.search.closed:
+            if self.search.chosen is not None:
+                self.current_prompt.text = list(self.search.chosen)
+            self.search = None
+            self.shared.damage.everything()
+
+    def update_prompts(self):
+        """Updates the prompts still active, those running sharing one
+        output budget per frame so that more of them don't slow it down"""
+
+        # Frames held back by the frame cap leave time to spare for it
+        budget = max(self.OUTPUT_BUDGET, self.shared.scheduler.frame_time / 2)
+        deadline = time.perf_counter() + budget
+        prompts = self.active_prompts
+        running = sum(prompt.released for prompt in prompts)
+        if running:
+            self.freeze_output()
+        for prompt in prompts:
+            now = time.perf_counter()
+            # What one leaves unused goes to those after it
+            share = max(deadline - now, 0) / max(running, 1)
+            running -= prompt.released
+            prompt.update(now + share)
+
+    def freeze_output(self):
+        """Every line of output is an object the collector tracks, so a
+        full collection scans them all and can stall a frame for 100ms.
+        Before one comes due, whatever survived the young generations is
+        frozen out of its reach, left to reference counting alone, which
+        is all output needs."""
+
+        if gc.get_count()[2] >= gc.get_threshold()[2]:
+            gc.collect(1)
+            gc.freeze()
+
     def update(self):
-        self.current_prompt.update()
-        self.special_commands()
+        if self.shared.data.config["isolate-commands"]:
+            self.pool.refill()
+        self.on_search()
+        self.update_prompts()
         self.on_release()
+        self.on_finish()
+        self.reflow()
         self.update_copies()
         self.handle_perm_offset()
         self.on_page_up()
+        self.check_placement()
+
+    def check_placement(self):
+        """Redraws the whole window once prompts moved, as after
+        scrolling or when one is added, finished or cleared"""
+
+        placement = (
+            self.perm_offset,
+            len(self.prompts),
+            len(self.offsets),
+            self.offsets[-1],
+        )
+        if placement != self.placement:
+            self.placement = placement
+            self.shared.damage.everything()
 
     def draw(self):
-        offset = 0
-        for prompt, btn in itertools.zip_longest(self.prompts, self.copy_buttons):
-            prompt.draw(offset + self.perm_offset)
-            if btn is not None:
-                btn.draw(offset + self.perm_offset)
-            offset += prompt.full_surf.get_height() + 10
+        """Draws from the first prompt in view, found by binary search
+        over the offsets, down to the bottom edge of the window"""
+
+        start = max(bisect.bisect_right(self.offsets, -self.perm_offset) - 1, 0)
+        offset = self.offsets[start]
+        bottom = self.shared.screen.get_height()
+        index = start
+        while index < len(self.prompts) and offset + self.perm_offset < bottom:
+            self.prompts[index].draw(offset + self.perm_offset)
+            if index < len(self.copy_buttons):
+                self.copy_buttons[index].draw(offset + self.perm_offset)
+            offset += self.prompts[index].height + 10
+            index += 1
+
+        visible = range(start, index)
+        for hidden in self.visible:
+            if hidden not in visible and hidden < len(self.prompts):
+                self.prompts[hidden].forget_surfaces()
+        self.visible = visible
+
+        if self.search is not None:
+            self.search.draw()
@@ -12,6 +12,9 @@ class TerminalState:
         self.next_state: State | None = None
         self.terminal = Terminal()
 
+    def on_win_resize(self):
+        self.terminal.on_win_resize()
+
     def update(self):
         self.terminal.update()
 
@@ -1,3 +1,4 @@
+import heapq
 import itertools
 import math
 import time
@@ -44,6 +45,10 @@ class Time:
     def reset(self):
         self.start = time.perf_counter()
 
+    @property
+    def deadline(self) -> float:
+        return self.start + self.time_to_pass
+
     def tick(self) -> bool:
         if time.perf_counter() - self.start > self.time_to_pass:
             self.start = time.perf_counter()
@@ -63,6 +68,10 @@ class TimeOnce:
     def reset(self):
         self.start = time.perf_counter()
 
+    @property
+    def deadline(self) -> float:
+        return self.start + self.time_to_pass
+
     def tick(self) -> bool:
         if time.perf_counter() - self.start > self.time_to_pass:
             return True
@@ -233,3 +242,11 @@ def scale_add(img: pygame.Surface, term: float | int) -> pygame.Surface:
     return pygame.transform.scale(
         img, (img.get_width() + term, img.get_height() + term)
     )
+
+
+def sorted_in_runs(items: t.Sequence[str], run: int) -> list[str]:
+    """Sorts the items from a thread without starving the frame loop, in
+    runs merged after, as one long sort would hold the GIL"""
+
+    runs = [sorted(items[start : start + run]) for start in range(0, len(items), run)]
+    return runs[0] if len(runs) == 1 else list(heapq.merge(*runs))
@@ -0,0 +1,26 @@
+from pathlib import Path
+
+from src.shell import CwdTracker
+
+SEQUENCE = b"before\x1b[1m\x1b]7;file://vm/tmp/a%20b\x07after"
+
+
+def test_cwd_tracker_split_at_every_offset():
+    for split in range(len(SEQUENCE) + 1):
+        output = []
+        tracker = CwdTracker(output.append)
+        tracker.feed(SEQUENCE[:split])
+        tracker.feed(SEQUENCE[split:])
+        tracker.close()
+        assert b"".join(output) == b"before\x1b[1mafter", split
+        assert tracker.cwd == Path("/tmp/a b"), split
+
+
+def test_cwd_tracker_passes_on_other_sequences():
+    output = []
+    tracker = CwdTracker(output.append)
+    tracker.feed(b"\x1b]7;not a url\x07text\x1b")
+    assert b"".join(output) == b"\x1b]7;not a url\x07text"
+    tracker.close()
+    assert b"".join(output) == b"\x1b]7;not a url\x07text\x1b"
+    assert tracker.cwd is None